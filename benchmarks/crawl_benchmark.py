@@ -0,0 +1,255 @@
+"""End-to-end crawl benchmark against a synthetic web, with no internet or AWS access.
+
+    python benchmarks/crawl_benchmark.py [--crawlers 4] [--async] [--pages 2000] [--json results.json]
+
+Starts the synthetic site, then the real master_node, crawler_node and
+indexer_node scripts as separate processes. They share the local SQLite
+queue backend and blob store in a scratch directory. The crawl runs until
+the frontier drains (or --duration passes) and everything sent to the
+indexer is committed. The benchmark then reports pages/sec, fetch-to-index
+latency and the time spent in each pipeline stage (from trace spans), and
+the peak memory of each node.
+
+The master listens on port 5001, the indexer on 5003 and crawler N's
+metrics on 9100 + N, so nothing else may be using those ports.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import requests
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_site import add_site_arguments, site_from_arguments
+
+MASTER_URL = "http://127.0.0.1:5001"
+INDEXER_URL = "http://127.0.0.1:5003"
+STARTUP_TIMEOUT = 60  # seconds for the nodes to come up
+INDEX_DRAIN_TIMEOUT = 60  # seconds to wait for the indexer to commit everything once crawling stops
+POLL_INTERVAL = 1  # seconds between progress samples
+IDLE_POLLS = 3  # consecutive samples with an empty frontier and no tasks in flight that end the crawl
+
+# Talk to the local nodes directly, whatever proxy the environment sets
+session = requests.Session()
+session.trust_env = False
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def scrape(url):
+    """Metric values from a /metrics endpoint, by series name (labels included)"""
+    values = {}
+    for line in session.get(f"{url}/metrics", timeout=5).text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            values[name] = float(value)
+    return values
+
+def memory_mb(pid):
+    """Resident memory of a process in MB, or None if it cannot be read"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2**20
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def start_node(name, script, args, workdir, env):
+    log = open(os.path.join(workdir, f"{name}.log"), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script)] + args,
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return name, process
+
+def wait_until(condition, timeout, what):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if condition():
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+def stop_nodes(nodes):
+    """Interrupt every node so atexit handlers flush queues and traces, killing any that hang"""
+    for _, process in nodes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for _, process in nodes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def read_spans(path):
+    spans = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return spans
+
+def latency_report(spans):
+    """Fetch-to-index latency of each indexed page, and durations of each span name"""
+    fetch_start = {}
+    indexed_end = {}
+    stages = {}
+    for span in spans:
+        duration = span["end"] - span["start"]
+        stages.setdefault(span["name"], []).append(duration)
+        if span["name"] == 'crawler.fetch':
+            fetch_start[span["trace_id"]] = min(span["start"], fetch_start.get(span["trace_id"], span["start"]))
+        elif span["name"] == 'crawl' and span["attributes"].get("indexed"):
+            indexed_end[span["trace_id"]] = span["end"]
+    latencies = [end - fetch_start[trace_id] for trace_id, end in indexed_end.items() if trace_id in fetch_start]
+    return latencies, stages
+
+def run(args):
+    site = site_from_arguments(args)
+    site.start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='crawl_benchmark_')
+    trace_file = os.path.join(workdir, 'traces.jsonl')
+
+    env = dict(os.environ,
+               QUEUE_BACKEND='local',
+               LOCAL_QUEUE_PATH=os.path.join(workdir, 'queues.db'),
+               BLOB_STORE='local',
+               BLOB_DIR=os.path.join(workdir, 'blob_store'),
+               ALLOWED_DOMAINS='127.0.0.',
+               TRACE_EXPORTER='jsonl',
+               TRACE_FILE=trace_file,
+               TRACE_SAMPLE_RATE=str(args.trace_sample_rate),
+               NO_PROXY='127.0.0.0/8,localhost',
+               PYTHONUNBUFFERED='1')
+    env.pop('ROBOTS_CACHE_DIR', None)
+
+    crawler_args = ['--async', '--concurrency', str(args.concurrency)] if args.use_async else []
+    nodes = [start_node('indexer', 'indexer_node.py', [], workdir, env),
+             start_node('master', 'master_node.py', [], workdir, env)]
+    nodes += [start_node(f'crawler-{i}', 'crawler_node.py', [str(i)] + crawler_args, workdir, env)
+              for i in range(args.crawlers)]
+    peak_memory = {}
+
+    def sample_memory():
+        for name, process in nodes:
+            rss = memory_mb(process.pid)
+            if rss is not None:
+                peak_memory[name] = max(rss, peak_memory.get(name, 0))
+
+    try:
+        print(f"Starting {args.crawlers} crawlers, master and indexer in {workdir}")
+        wait_until(lambda: session.get(f"{INDEXER_URL}/metrics", timeout=2).ok, STARTUP_TIMEOUT, "the indexer")
+        wait_until(lambda: scrape(MASTER_URL).get('master_active_crawlers', 0) >= args.crawlers,
+                   STARTUP_TIMEOUT, "the crawlers to join")
+
+        seeds = [site.url(i * site.pages // args.seeds) for i in range(args.seeds)]
+        session.post(f"{MASTER_URL}/add_urls", json={"urls": seeds}, timeout=10).raise_for_status()
+        start = time.time()
+        print(f"Crawling from {len(seeds)} seeds")
+
+        idle = 0
+        while time.time() - start < args.duration:
+            time.sleep(POLL_INTERVAL)
+            sample_memory()
+            metrics = scrape(MASTER_URL)
+            if metrics.get('master_frontier_size') == 0 and metrics.get('master_tasks_in_flight') == 0:
+                idle += 1
+                if idle >= IDLE_POLLS:
+                    break
+            else:
+                idle = 0
+        crawl_end = time.time() - (idle * POLL_INTERVAL if idle >= IDLE_POLLS else 0)
+        status = session.get(f"{MASTER_URL}/status", timeout=5).json()
+
+        # Wait for the indexer to commit every document the master forwarded
+        def indexed():
+            return int(scrape(INDEXER_URL).get('indexer_documents_total', 0))
+        try:
+            wait_until(lambda: indexed() >= status["urls_indexed"], INDEX_DRAIN_TIMEOUT, "the indexer")
+        except RuntimeError as e:
+            print(f"Warning: {e}")
+        index_end = time.time()
+        sample_memory()
+        documents = indexed()
+    finally:
+        stop_nodes(nodes)
+
+    latencies, stages = latency_report(read_spans(trace_file))
+    crawl_time = crawl_end - start
+    results = {
+        "pages_crawled": status["urls_crawled"],
+        "failed_tasks": status["failed_urls"],
+        "documents_indexed": documents,
+        "crawl_seconds": round(crawl_time, 2),
+        "pages_per_second": round(status["urls_crawled"] / crawl_time, 2),
+        "indexed_per_second": round(documents / (index_end - start), 2),
+        "fetch_to_index_p50": percentile(latencies, 0.5),
+        "fetch_to_index_p99": percentile(latencies, 0.99),
+        "stages": {name: {"count": len(durations),
+                          "mean": sum(durations) / len(durations),
+                          "p50": percentile(durations, 0.5),
+                          "p99": percentile(durations, 0.99)}
+                   for name, durations in sorted(stages.items())},
+        "peak_memory_mb": {name: round(rss, 1) for name, rss in peak_memory.items()},
+        "workdir": workdir,
+    }
+    return results
+
+def print_report(results):
+    print(f"\nPages crawled:      {results['pages_crawled']} in {results['crawl_seconds']}s "
+          f"({results['pages_per_second']} pages/sec)")
+    print(f"Documents indexed:  {results['documents_indexed']} ({results['indexed_per_second']} docs/sec)")
+    if results["fetch_to_index_p50"] is not None:
+        print(f"Fetch to index:     p50 {results['fetch_to_index_p50'] * 1000:.0f}ms, "
+              f"p99 {results['fetch_to_index_p99'] * 1000:.0f}ms")
+    print("\nStage                         count    mean ms     p50 ms     p99 ms")
+    for name, stage in results["stages"].items():
+        print(f"{name:<28} {stage['count']:>6} {stage['mean'] * 1000:>10.1f} {stage['p50'] * 1000:>10.1f} "
+              f"{stage['p99'] * 1000:>10.1f}")
+    print("\nPeak memory (MB)")
+    for name, rss in results["peak_memory_mb"].items():
+        print(f"{name:<28} {rss:>8.1f}")
+    print(f"\nLogs and traces: {results['workdir']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the crawl pipeline against a synthetic web")
+    add_site_arguments(parser)
+    parser.add_argument("--crawlers", type=int, default=2, help="crawler processes")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run crawlers in async mode")
+    parser.add_argument("--concurrency", type=int, default=20, help="fetches in flight per async crawler")
+    parser.add_argument("--seeds", type=int, default=20, help="seed pages, spread over the site")
+    parser.add_argument("--duration", type=float, default=300, help="maximum seconds to crawl")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0, help="fraction of tasks traced")
+    parser.add_argument("--workdir", help="directory for queues, blobs, index, logs and traces")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,118 @@
+"""Compare page extraction backends against the original BeautifulSoup implementation.
+
+    python benchmarks/extraction_benchmark.py [--pages 200] [page.html ...]
+
+Checks that every backend returns the same links and text as the original
+function, then reports the time per page and the speedup of each backend.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from url_canon import canonicalize_url
+from extractor import EXTRACTORS
+
+BASE_URL = "https://docs.python.org/3/library/index.html"
+
+# Markup where parsers are known to disagree, checked against the original on every run
+EDGE_CASES = {
+    "cdata": '<p><![CDATA[hi]]>there</p>',
+    "textarea": '<form><textarea>t <b> x</textarea></form><p>after</p>',
+    "uppercase textarea": '<TEXTAREA>a <i>b</i></TEXTAREA>',
+    "duplicate href": '<a href="/first" href="/second">x</a>',
+    "script and style": '<script>var a = "<a href=/no>";</script><style>p {}</style><p>text</p>',
+    "comment": '<p>a<!-- <a href="/hidden">x</a> -->b</p>',
+    "entities": '<p>fish &amp; chips &eacute;&nbsp;caf&#233;</p><a href="/a?x=1&amp;y=2">q</a>',
+    "unclosed tags": '<div><p>one<p>two<li><a href=/u>three',
+}
+# Differences accepted for a backend; lxml follows the HTML spec and keeps the first duplicate attribute
+KNOWN_DIFFERENCES = {"lxml": {"duplicate href"}}
+
+def original_extract(html, base_url):
+    """extract_links_and_text as it was before the extraction engine"""
+    soup = BeautifulSoup(html, 'html.parser')
+    text = soup.get_text(separator=' ', strip=True)
+    links = set()
+
+    for a in soup.find_all('a', href=True):
+        href = canonicalize_url(a['href'], base_url)
+        if href and urlparse(href).scheme in ['http', 'https']:
+            links.add(href)
+
+    return list(links), text
+
+def synthetic_page(rng):
+    """A documentation-like page: navigation, headings, paragraphs, code and scripts"""
+    words = ["python", "module", "function", "returns", "the", "value", "of", "an", "object",
+             "list", "string", "&amp;", "class", "method", "argument", "default", "é", "none"]
+    nav = ''.join(f'<li><a href="/3/library/{rng.randrange(500)}.html?utm_source=nav">Page {i}</a></li>'
+                  for i in range(40))
+    sections = []
+    for i in range(rng.randrange(10, 30)):
+        paragraph = ' '.join(rng.choice(words) for _ in range(rng.randrange(30, 120)))
+        links = ' '.join(f'<a href="../{rng.randrange(300)}/x.html#s{i}">ref</a>' for _ in range(rng.randrange(1, 6)))
+        sections.append(f'<h2 id="s{i}">Section {i}</h2><p>{paragraph} {links}</p>'
+                        f'<pre><code>def f(x):\n    return x &lt; {i}</code></pre><!-- note {i} -->')
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Library Reference</title>'
+            '<meta name="robots" content="index, follow"><style>body { margin: 0 }</style>'
+            '<script>var DOCUMENTATION_OPTIONS = {};</script></head><body>'
+            f'<nav><ul>{nav}</ul></nav><main>{"".join(sections)}</main>'
+            '<footer><a href="https://www.python.org/psf/">PSF</a> <a href="mailto:docs@python.org">Mail</a></footer>'
+            '</body></html>')
+
+def time_per_page(extract, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            extract(html, BASE_URL)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction backends")
+    parser.add_argument("files", nargs="*", help="HTML files to use instead of synthetic pages")
+    parser.add_argument("--pages", type=int, default=200, help="number of synthetic pages")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend; the fastest is reported")
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for path in args.files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    else:
+        rng = random.Random(42)
+        pages = [synthetic_page(rng) for _ in range(args.pages)]
+    print(f"{len(pages)} pages, {sum(len(p) for p in pages) / len(pages) / 1024:.1f} KB on average")
+
+    expected = [original_extract(html, BASE_URL) for html in pages]
+    baseline = time_per_page(original_extract, pages, args.repeat)
+    print(f"{'original (bs4)':<16} {baseline * 1000:8.3f} ms/page")
+
+    for name, extract in EXTRACTORS.items():
+        for case, html in EDGE_CASES.items():
+            links, text = original_extract(html, BASE_URL)
+            page = extract(html, BASE_URL)
+            if set(page.links) != set(links) or page.text != text:
+                known = " (known difference)" if case in KNOWN_DIFFERENCES.get(name, ()) else ""
+                print(f"{name}: '{case}' differs from the original{known}: "
+                      f"{sorted(page.links)} {page.text!r} != {sorted(links)} {text!r}")
+
+    for name, extract in EXTRACTORS.items():
+        mismatches = 0
+        for html, (links, text) in zip(pages, expected):
+            page = extract(html, BASE_URL)
+            if set(page.links) != set(links) or page.text != text:
+                mismatches += 1
+        per_page = time_per_page(extract, pages, args.repeat)
+        print(f"{name:<16} {per_page * 1000:8.3f} ms/page  {baseline / per_page:5.1f}x  "
+              f"{mismatches} pages differ from the original")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Serve a synthetic web for offline crawl benchmarks.
+
+    python benchmarks/synthetic_site.py [--pages 2000] [--hosts 10] [--port 8800]
+
+Pages are spread over several loopback hosts (127.0.0.1, 127.0.0.2, ...)
+so per-host politeness behaves as it would on the real web. Every page is
+generated from its number, so the site graph is the same on every run
+with the same options.
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ["crawler", "index", "python", "queue", "search", "result", "page", "link", "host", "frontier",
+         "shard", "latency", "document", "worker", "the", "of", "and", "to", "a", "in", "is", "for"]
+
+class SyntheticSite:
+    """A deterministic site graph: page sizes, links, slow pages, errors and robots.txt rules"""
+
+    def __init__(self, pages=2000, fan_out=10, page_size=5000, latency=0.01, error_rate=0.01,
+                 disallow_rate=0.05, crawl_delay=0, hosts=10, port=8800, seed=0):
+        self.pages = pages
+        self.fan_out = fan_out
+        self.page_size = page_size  # mean bytes of text per page
+        self.latency = latency  # mean seconds before a page is served
+        self.error_rate = error_rate  # fraction of pages answering 500
+        self.disallow_rate = disallow_rate  # fraction of pages under /private/, disallowed by robots.txt
+        self.crawl_delay = crawl_delay  # whole seconds, as urllib.robotparser ignores fractions
+        self.hosts = hosts
+        self.port = port
+        self.seed = seed
+
+    def _rng(self, page):
+        return random.Random(self.seed * 1000003 + page)
+
+    def host(self, page):
+        return f"127.0.0.{1 + page % self.hosts}"
+
+    def is_error(self, page):
+        return self._rng(page).random() < self.error_rate
+
+    def is_disallowed(self, page):
+        return random.Random(self.seed * 1000003 + page + 500009).random() < self.disallow_rate
+
+    def url(self, page):
+        directory = 'private' if self.is_disallowed(page) else 'p'
+        return f"http://{self.host(page)}:{self.port}/{directory}/{page}.html"
+
+    def links(self, page):
+        """Pages linked from `page`: mostly nearby pages, some anywhere on the site"""
+        rng = self._rng(page)
+        targets = {(page + 1) % self.pages}
+        while len(targets) < min(self.fan_out, self.pages - 1):
+            if rng.random() < 0.7:
+                target = (page + rng.randint(-50, 50)) % self.pages
+            else:
+                target = rng.randrange(self.pages)
+            if target != page:
+                targets.add(target)
+        return sorted(targets)
+
+    def render(self, page):
+        rng = self._rng(page)
+        size = max(100, int(rng.gauss(self.page_size, self.page_size / 3)))
+        words, length = [], 0
+        while length < size:
+            word = rng.choice(WORDS) if rng.random() < 0.7 else f"w{rng.randrange(100000)}"
+            words.append(word)
+            length += len(word) + 1
+        anchors = ''.join(f'<li><a href="{self.url(target)}">Page {target}</a></li>' for target in self.links(page))
+        return (f"<!DOCTYPE html><html><head><title>Page {page}</title></head><body>"
+                f"<h1>Page {page}</h1><p>{' '.join(words)}</p><ul>{anchors}</ul></body></html>")
+
+    def robots_txt(self):
+        return f"User-agent: *\nDisallow: /private/\nCrawl-delay: {self.crawl_delay}\n"
+
+    def respond(self, path):
+        """Return (status, content type, body) for a request path"""
+        if path == '/robots.txt':
+            return 200, 'text/plain', self.robots_txt()
+        directory, _, name = path.strip('/').partition('/')
+        try:
+            page = int(name.split('.')[0])
+        except ValueError:
+            return 404, 'text/plain', 'Not found'
+        if not 0 <= page < self.pages or directory != ('private' if self.is_disallowed(page) else 'p'):
+            return 404, 'text/plain', 'Not found'
+        if self.latency:
+            time.sleep(random.expovariate(1 / self.latency))
+        if self.is_error(page):
+            return 500, 'text/plain', 'Internal server error'
+        return 200, 'text/html; charset=utf-8', self.render(page)
+
+    def start(self):
+        """Serve the site on every host address from background threads, returning the servers"""
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, as crawlers reuse connections
+
+            def do_GET(self):
+                status, content_type, body = site.respond(self.path.split('?')[0])
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        servers = []
+        for index in range(self.hosts):
+            server = ThreadingHTTPServer((f"127.0.0.{1 + index}", self.port), Handler)
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            servers.append(server)
+        return servers
+
+def add_site_arguments(parser):
+    parser.add_argument("--pages", type=int, default=2000, help="pages on the site")
+    parser.add_argument("--fan-out", type=int, default=10, help="links per page")
+    parser.add_argument("--page-size", type=int, default=5000, help="mean bytes of text per page")
+    parser.add_argument("--latency", type=float, default=0.01, help="mean seconds to serve a page")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="fraction of pages answering 500")
+    parser.add_argument("--disallow-rate", type=float, default=0.05, help="fraction of pages disallowed by robots.txt")
+    parser.add_argument("--crawl-delay", type=int, default=0, help="Crawl-delay in robots.txt (seconds)")
+    parser.add_argument("--hosts", type=int, default=10, help="loopback hosts the pages are spread over")
+    parser.add_argument("--port", type=int, default=8800, help="port served on every host")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the site graph")
+
+def site_from_arguments(args):
+    return SyntheticSite(args.pages, args.fan_out, args.page_size, args.latency, args.error_rate,
+                         args.disallow_rate, args.crawl_delay, args.hosts, args.port, args.seed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic site for crawl benchmarks")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_arguments(args)
+    site.start()
+    print(f"Serving {site.pages} pages on {site.hosts} hosts; start at {site.url(0)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sys.exit(0)
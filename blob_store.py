@@ -0,0 +1,105 @@
+import os
+import zlib
+import uuid
+import hashlib
+import logging
+import threading
+
+# Blob Store Configuration
+BLOB_STORE = os.environ.get('BLOB_STORE')  # 'local' (directory, shared if nodes are on several machines), 's3', or unset to send content inline
+BLOB_DIR = os.environ.get('BLOB_DIR', 'blob_store')
+BLOB_BUCKET = os.environ.get('BLOB_BUCKET', 'crawler-content')
+BLOB_ENDPOINT_URL = os.environ.get('BLOB_ENDPOINT_URL')  # for S3-compatible stores such as MinIO
+COMPRESSION_LEVEL = 6
+
+class LocalBlobStore:
+    """Blobs stored as files under a directory, which may be a shared mount"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial blob
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+class S3BlobStore:
+    """Blobs stored as objects in an S3 (or S3-compatible) bucket"""
+
+    def __init__(self, bucket, endpoint_url=None):
+        import boto3
+        from utils import AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY
+
+        self.bucket = bucket
+        self.s3 = boto3.client('s3',
+            region_name=AWS_REGION,
+            aws_access_key_id=AWS_ACCESS_KEY,
+            aws_secret_access_key=AWS_SECRET_KEY,
+            endpoint_url=endpoint_url
+        )
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def get(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the configured blob store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if not BLOB_STORE:
+                    raise ValueError("No blob store configured; set BLOB_STORE")
+                if BLOB_STORE == 'local':
+                    _store = LocalBlobStore(BLOB_DIR)
+                elif BLOB_STORE == 's3':
+                    _store = S3BlobStore(BLOB_BUCKET, BLOB_ENDPOINT_URL)
+                else:
+                    raise ValueError(f"Unknown blob store: {BLOB_STORE}")
+    return _store
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def store_content(text):
+    """Compress and store page text, returning the claim check to put in messages"""
+    key = content_hash(text)
+    data = zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+    store = get_store()
+    # Content addressed, so identical pages are stored once
+    if not store.exists(key):
+        store.put(key, data)
+    logging.debug(f"Stored content {key}: {len(text)} chars in {len(data)} bytes")
+    return {"content_hash": key, "content_size": len(data)}
+
+def load_content(key):
+    """Fetch and decompress page text stored by store_content()"""
+    return zlib.decompress(get_store().get(key)).decode('utf-8')
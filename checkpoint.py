@@ -0,0 +1,100 @@
+import os
+import re
+import json
+import pickle
+import logging
+import threading
+
+SNAPSHOT_FILE = 'snapshot.pkl'
+JOURNAL_PATTERN = re.compile(r'journal-(\d+)\.log$')
+
+def _journal_path(directory, generation):
+    return os.path.join(directory, f'journal-{generation:08d}.log')
+
+def _journal_generations(directory):
+    generations = []
+    for name in os.listdir(directory):
+        match = JOURNAL_PATTERN.match(name)
+        if match:
+            generations.append(int(match.group(1)))
+    return sorted(generations)
+
+class Journal:
+    """Append-only log of state mutations, one JSON array per line.
+
+    The log is split into numbered segments. rotate() starts a new segment
+    just before a snapshot is taken, so once the snapshot is saved every
+    older segment can be deleted. With no directory, records are discarded.
+    """
+
+    def __init__(self, directory=None, generation=0):
+        self.directory = directory
+        self.generation = generation
+        self._file = None
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(_journal_path(directory, generation), 'a', encoding='utf-8')
+
+    def record(self, *entry):
+        if self._file is None:
+            return
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.flush()
+
+    def rotate(self):
+        """Start a new segment and return its generation"""
+        with self._lock:
+            self._file.close()
+            self.generation += 1
+            self._file = open(_journal_path(self.directory, self.generation), 'a', encoding='utf-8')
+            return self.generation
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+
+def save_snapshot(directory, generation, state):
+    """Atomically write a snapshot taken after rotating to `generation`, then drop older journal segments"""
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({"generation": generation, "state": state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    for old in _journal_generations(directory):
+        if old < generation:
+            os.remove(_journal_path(directory, old))
+
+def load_checkpoint(directory):
+    """Return (snapshot state or None, journal records to replay, next journal generation)"""
+    if not directory or not os.path.isdir(directory):
+        return None, [], 0
+
+    state, generation = None, 0
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        state, generation = snapshot["state"], snapshot["generation"]
+
+    generations = [g for g in _journal_generations(directory) if g >= generation]
+    return state, _read_journals(directory, generations), max(generations + [generation]) + 1
+
+def _read_journals(directory, generations):
+    for generation in generations:
+        with open(_journal_path(directory, generation), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line of a segment can be torn by a crash
+                    logging.warning(f"Skipping incomplete journal record in segment {generation}")
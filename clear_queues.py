@@ -1,6 +1,6 @@
 import boto3
 import json
-from sqs_utils import CRAWLER_QUEUE_NAME, INDEXER_QUEUE_NAME, RESULT_QUEUE_NAME
+from sqs_utils import CRAWLER_QUEUE_NAME, INDEXER_QUEUE_NAME, RESULT_QUEUE_NAME, SEARCH_REPLY_QUEUE_NAME, CONTROL_QUEUE_NAME
 from utils import AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY
 
 def get_sqs_client():
@@ -18,6 +18,16 @@ def get_queue_url(sqs, queue_name):
         print(f"Error getting queue URL for {queue_name}: {e}")
         return None
 
+def get_indexer_queues(sqs):
+    """The indexer queue plus every shard's indexer-queue-N that exists"""
+    try:
+        response = sqs.list_queues(QueueNamePrefix=INDEXER_QUEUE_NAME)
+        names = sorted(url.rsplit('/', 1)[-1] for url in response.get('QueueUrls', []))
+        return names or [INDEXER_QUEUE_NAME]
+    except Exception as e:
+        print(f"Error listing indexer shard queues: {e}")
+        return [INDEXER_QUEUE_NAME]
+
 def list_messages(queue_url, sqs):
     try:
         response = sqs.receive_message(
@@ -46,7 +56,7 @@ def purge_queue(queue_url, sqs):
 
 def main():
     sqs = get_sqs_client()
-    queues = [CRAWLER_QUEUE_NAME, INDEXER_QUEUE_NAME, RESULT_QUEUE_NAME]
+    queues = [CRAWLER_QUEUE_NAME] + get_indexer_queues(sqs) + [RESULT_QUEUE_NAME, SEARCH_REPLY_QUEUE_NAME, CONTROL_QUEUE_NAME]
     
     print("Available queues:")
     for queue_name in queues:
@@ -127,7 +127,7 @@ with open('templates/index.html', 'w') as f:
                             <div class="col-md-6">
                                 <div class="alert alert-info">
                                     <h6>Crawler Status</h6>
-                                    <p><strong>Active Crawlers:</strong> ${data.active_crawlers || 0}/2</p>
+                                    <p><strong>Active Crawlers:</strong> ${data.active_crawlers || 0} (desired: ${data.desired_crawlers || 0})</p>
                                     <p><strong>URLs Crawled:</strong> ${data.urls_crawled || 0}</p>
                                     <p><strong>URLs in Queue:</strong> ${data.urls_in_queue || 0}</p>
                                     <p><strong>Failed URLs:</strong> ${data.failed_urls || 0}</p>
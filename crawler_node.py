@@ -1,194 +1,406 @@
 import time
+import codecs
 import logging
 import json
+import asyncio
+import argparse
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, urldefrag
-import urllib.robotparser
-from sqs_utils import send_message, receive_messages, delete_message, CRAWLER_QUEUE_NAME, RESULT_QUEUE_NAME
+from host_scheduler import HostScheduler
+from http_client import HttpClient
+from robots import RobotsCache
+from url_canon import canonicalize_url
+from extractor import extract_page
+from frontier import url_host
+from metrics import Counter, Gauge, Histogram, start_metrics_server
+from tracing import set_service, span, record_span, mark_stage, stage_time
+from blob_store import BLOB_STORE, store_content
+from near_dup import simhash
+from sqs_utils import send_message, receive_messages, delete_message, delete_messages_batch, change_message_visibility, MAX_BATCH_SIZE, CRAWLER_QUEUE_NAME, RESULT_QUEUE_NAME, CONTROL_QUEUE_NAME
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Crawler - %(levelname)s - %(message)s')
 
 # Global Config
-CRAWL_DELAY = 1  # polite delay between requests (seconds)
+CRAWL_DELAY = 1  # polite delay between requests to the same host (seconds)
 USER_AGENT = "DistributedCrawlerBot/1.0"
+DEFAULT_CONCURRENCY = 100  # fetches in flight per process in async mode
+MAX_HOST_WAIT = 10  # seconds an async task may wait for its host; well under the queue visibility and lease timeouts
+HEARTBEAT_INTERVAL = 3  # seconds between heartbeats on the control queue
+METRICS_PORT = 9100  # metrics for crawler N are served on METRICS_PORT + N
 
-# Robots.txt Cache
-robots_cache = {}
+# Metrics
+FETCH_SECONDS = Histogram('crawler_fetch_seconds', 'Time to fetch a page, from request to end of body', ['host', 'status'])
+PARSE_SECONDS = Histogram('crawler_parse_seconds', 'Time to extract links and text from a page')
+PAGES = Counter('crawler_pages_total', 'Fetch attempts by outcome', ['outcome'])
+TASKS_IN_FLIGHT = Gauge('crawler_tasks_in_flight', 'Tasks being crawled by this process')
+TASKS_DEFERRED = Counter('crawler_tasks_deferred_total', 'Tasks handed back to the queue because their host was booked too far ahead')
+MAX_BODY_BYTES = 5 * 1024 * 1024  # pages are truncated to this many bytes (after decompression)
+READ_CHUNK_SIZE = 64 * 1024  # bytes read from the socket at a time
+
+# Keep-alive sessions pooled per host
+http_client = HttpClient(USER_AGENT)
+
+# robots.txt rules, cached with a TTL and shared between crawlers if ROBOTS_CACHE_DIR is set
+robots_cache = RobotsCache(http_client, USER_AGENT)
+
+# Progress reported with each heartbeat instead of one message per task
+started_tasks = []  # tasks picked up since the last heartbeat
+pages_crawled = 0  # results sent since start, so the master can measure this crawler's throughput
+progress_lock = threading.Lock()
 
 def is_allowed_by_robots(url):
-    parsed = urlparse(url)
-    domain = parsed.scheme + "://" + parsed.netloc
+    return robots_cache.allowed(url)
 
-    if domain not in robots_cache:
-        robots_url = urljoin(domain, "/robots.txt")
-        rp = urllib.robotparser.RobotFileParser()
-        try:
-            rp.set_url(robots_url)
-            rp.read()
-            robots_cache[domain] = rp
-            logging.info(f"Fetched robots.txt for domain: {domain}")
-        except Exception as e:
-            logging.warning(f"Failed to fetch robots.txt for {domain}, assuming allowed. Error: {e}")
-            return True  # Assume allowed if robots.txt fails
+def get_crawl_delay(url):
+    """Return the Crawl-delay from an already fetched robots.txt, or None"""
+    return robots_cache.crawl_delay(url)
 
-    return robots_cache[domain].can_fetch(USER_AGENT, url)
+# Politeness is tracked per host, so different hosts never wait on each other
+host_scheduler = HostScheduler(CRAWL_DELAY, get_crawl_delay)
 
 def normalize_url(url, base_url):
-    try:
-        url = urljoin(base_url, url)         # Convert relative URLs to absolute
-        url, _ = urldefrag(url)              # Remove fragments like #section
-        return url
-    except:
-        return None
+    # Resolves relative URLs, drops fragments and collapses equivalent spellings
+    return canonicalize_url(url, base_url)
 
 def extract_links_and_text(html, base_url):
-    soup = BeautifulSoup(html, 'html.parser')
-    text = soup.get_text(separator=' ', strip=True)
-    links = set()
+    page = extract_page(html, base_url)
+    return page.links, page.text
+
+def read_body(response, max_bytes=MAX_BODY_BYTES):
+    """Read and decode a streamed response incrementally, stopping after max_bytes.
+
+    Returns (text, truncated).
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
 
-    for a in soup.find_all('a', href=True):
-        href = normalize_url(a['href'], base_url)
-        if href and urlparse(href).scheme in ['http', 'https']:
-            links.add(href)
+    parts = []
+    remaining = max_bytes
+    for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+        if len(chunk) >= remaining:
+            parts.append(decoder.decode(chunk[:remaining], final=True))
+            return ''.join(parts), True
+        parts.append(decoder.decode(chunk))
+        remaining -= len(chunk)
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts), False
 
-    return list(links), text
+def crawl_url(url, crawler_id, wait_for_host=True, validators=None, trace=None):
+    """Fetch and parse a page, returning (links, text, fetch info).
 
-def crawl_url(url, crawler_id):
-    headers = {"User-Agent": USER_AGENT}
+    `validators` holds the ETag and Last-Modified from an earlier fetch, which
+    are sent as conditional headers; fetch info reports the new validators and
+    whether the server answered 304 Not Modified. Host wait, fetch and parse
+    are recorded as spans of `trace`.
+    """
+    validators = validators or {}
+    info = {"not_modified": False}
 
     try:
         logging.info(f"Crawler {crawler_id} starting to fetch URL: {url}")
-        time.sleep(CRAWL_DELAY)  # politeness
+        if not is_allowed_by_robots(url):
+            logging.info(f"Crawler {crawler_id} skipping {url}: disallowed by robots.txt")
+            PAGES.inc(outcome='robots_disallowed')
+            return [], None, info
+
+        if wait_for_host:
+            with span(trace, 'crawler.host_wait'):
+                host_scheduler.wait(url)  # politeness
         
-        response = requests.get(url, headers=headers, timeout=10)
-        logging.info(f"Crawler {crawler_id} got response: {response.status_code}")
+        # Streamed, so the status and headers can be checked before any of the body is downloaded
+        fetch_start = time.time()
+        status = 'error'
+        try:
+            with http_client.get(url, etag=validators.get("etag"), last_modified=validators.get("last_modified"),
+                                 timeout=10, stream=True) as response:
+                status = response.status_code
+                logging.info(f"Crawler {crawler_id} got response: {response.status_code}")
+
+                if response.status_code == 304:
+                    logging.info(f"Crawler {crawler_id} found {url} unchanged")
+                    info["not_modified"] = True
+                    PAGES.inc(outcome='not_modified')
+                    return [], None, info
+
+                if response.status_code != 200:
+                    logging.warning(f"Invalid response for {url}: {response.status_code}")
+                    PAGES.inc(outcome='http_error')
+                    return [], None, info
 
-        if response.status_code != 200:
-            logging.warning(f"Invalid response for {url}: {response.status_code}")
-            return [], None
+                content_type = response.headers.get('Content-Type', '')
+                if 'text/html' not in content_type:
+                    logging.warning(f"Non-HTML content for {url}: {content_type}")
+                    PAGES.inc(outcome='not_html')
+                    return [], None, info
 
-        content_type = response.headers.get('Content-Type', '')
-        if 'text/html' not in content_type:
-            logging.warning(f"Non-HTML content for {url}: {content_type}")
-            return [], None
+                info["etag"] = response.headers.get('ETag')
+                info["last_modified"] = response.headers.get('Last-Modified')
 
-        links, text = extract_links_and_text(response.text, url)
+                html, truncated = read_body(response)
+                if truncated:
+                    logging.warning(f"Crawler {crawler_id} truncated {url} to {MAX_BODY_BYTES} bytes")
+        finally:
+            FETCH_SECONDS.observe(time.time() - fetch_start, host=url_host(url), status=status)
+            record_span(trace, 'crawler.fetch', fetch_start, url=url, status=status)
+
+        with PARSE_SECONDS.time(), span(trace, 'crawler.parse', bytes=len(html)):
+            page = extract_page(html, url)
+        PAGES.inc(outcome='ok')
+        links, text = page.links, page.text
+        # Honour <meta name="robots"> directives
+        if page.robots & {'nofollow', 'none'}:
+            links = []
+        if page.robots & {'noindex', 'none'}:
+            text = None
         logging.info(f"Crawler {crawler_id} crawled {url}: Found {len(links)} links")
-        return links, text
+        return links, text, info
 
     except requests.RequestException as e:
         logging.error(f"Crawler {crawler_id} failed to fetch {url}: {str(e)}")
-        return [], None
+        PAGES.inc(outcome='fetch_error')
+        return [], None, info
     except Exception as e:
         logging.error(f"Crawler {crawler_id} unexpected error while crawling {url}: {str(e)}")
-        return [], None
+        return [], None, info
+
+def parse_task(crawler_id, message):
+    """Decode a crawler queue message, returning the task or None if it is invalid"""
+    try:
+        task = json.loads(message['Body'])
+    except json.JSONDecodeError as e:
+        logging.error(f"Crawler {crawler_id} received invalid JSON: {str(e)}")
+        delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
+        return None
+    
+    if not isinstance(task, dict):
+        logging.error(f"Crawler {crawler_id} received invalid task format")
+        delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
+        return None
+    
+    if not task.get("url"):
+        logging.error(f"Crawler {crawler_id} received task without URL")
+        delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
+        return None
+
+    trace = task.get("trace")
+    record_span(trace, 'crawler.queue_wait', stage_time(trace, "leased"))
+    mark_stage(trace, "received")
+    return task
+
+def process_task(crawler_id, task, wait_for_host=True):
+    """Crawl the task's URL and report the result, returning True once the result is sent"""
+    url = task["url"]
+    depth = task.get("depth", 0)
+    task_id = task.get("task_id")
+    
+    logging.info(f"Crawler {crawler_id} received URL: {url}")
+    
+    # Tell the master which crawler holds the task with the next heartbeat
+    if task_id:
+        with progress_lock:
+            started_tasks.append(task_id)
+    
+    trace = task.get("trace")
+    links, content, info = crawl_url(url, crawler_id, wait_for_host, task.get("validators"), trace)
+    
+    # Ensure links is a list
+    if not isinstance(links, list):
+        links = []
+    
+    # Send result
+    result = {
+        "url": url,
+        "extracted_urls": links,
+        "crawler_id": crawler_id,
+        "task_id": task_id,
+        "depth": depth
+    }
+
+    # Validators let the master make the next crawl of this page conditional
+    if info["not_modified"]:
+        result["not_modified"] = True
+    for key in ("etag", "last_modified"):
+        if info.get(key):
+            result[key] = info[key]
+
+    # Page text goes to the blob store if one is configured; the message then only carries its hash
+    if content:
+        # Fingerprint for near-duplicate detection on the master
+        result["simhash"] = format(simhash(content), '016x')
+    if content and not BLOB_STORE:
+        result["content"] = content
+    elif content:
+        try:
+            with span(trace, 'crawler.store', size=len(content)):
+                result.update(store_content(content))
+        except Exception as e:
+            logging.error(f"Crawler {crawler_id} failed to store content for {url}, sending it inline: {str(e)}")
+            result["content"] = content
+    
+    if trace:
+        mark_stage(trace, "result_sent")
+        result["trace"] = trace
+
+    # The result itself tells the master the task is complete
+    if not send_message(RESULT_QUEUE_NAME, result):
+        logging.error(f"Crawler {crawler_id} failed to send result for {url}")
+        return False
+    global pages_crawled
+    with progress_lock:
+        pages_crawled += 1
+    return True
+
+def report_error(crawler_id, error, task_id=None, trace=None):
+    logging.error(f"Error in crawler {crawler_id}: {str(error)}")
+    message = {
+        "error": str(error),
+        "crawler_id": crawler_id,
+        "task_id": task_id
+    }
+    if trace:
+        mark_stage(trace, "result_sent")
+        message["trace"] = trace
+    send_message(RESULT_QUEUE_NAME, message)
 
 def crawler_process(crawler_id):
     logging.info(f"Crawler {crawler_id} started")
     
     while True:
+        task = None
         try:
-            messages = receive_messages(CRAWLER_QUEUE_NAME)
+            # Take one task at a time so other idle crawlers can pull the rest
+            messages = receive_messages(CRAWLER_QUEUE_NAME, max_messages=1)
             if not messages:
                 time.sleep(1)
                 continue
                 
             message = messages[0]
-            try:
-                task = json.loads(message['Body'])
-            except json.JSONDecodeError as e:
-                logging.error(f"Crawler {crawler_id} received invalid JSON: {str(e)}")
-                delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
-                continue
-            
-            if not isinstance(task, dict):
-                logging.error(f"Crawler {crawler_id} received invalid task format")
-                delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
-                continue
-            
-            if task.get('crawler_id') != crawler_id:
-                # This message is for another crawler
-                time.sleep(0.1)
-                continue
-                
-            url = task.get("url")
-            if not url:
-                logging.error(f"Crawler {crawler_id} received task without URL")
-                delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
+            task = parse_task(crawler_id, message)
+            if task is None:
                 continue
-                
-            depth = task.get("depth", 0)
-            
-            logging.info(f"Crawler {crawler_id} received URL: {url}")
-            
-            # Send status update
-            send_message(RESULT_QUEUE_NAME, {
-                "status": f"Starting to crawl {url}",
-                "crawler_id": crawler_id
-            })
-            
-            links, content = crawl_url(url, crawler_id)
-            
-            # Ensure links is a list
-            if not isinstance(links, list):
-                links = []
-            
-            # Send result
-            result = {
-                "url": url,
-                "extracted_urls": links,
-                "content": content,
-                "crawler_id": crawler_id,
-                "depth": depth
-            }
-            
-            try:
-                send_message(RESULT_QUEUE_NAME, result)
-            except Exception as e:
-                logging.error(f"Crawler {crawler_id} failed to send result: {str(e)}")
-                continue
-            
-            # Send completion status
-            send_message(RESULT_QUEUE_NAME, {
-                "status": f"Completed {url}",
-                "crawler_id": crawler_id
-            })
             
             # Delete processed message
-            delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
+            with TASKS_IN_FLIGHT.track_in_progress():
+                sent = process_task(crawler_id, task)
+            if sent:
+                delete_message(CRAWLER_QUEUE_NAME, message['ReceiptHandle'])
             
         except Exception as e:
-            logging.error(f"Error in crawler {crawler_id}: {str(e)}")
-            send_message(RESULT_QUEUE_NAME, {
-                "error": str(e),
-                "crawler_id": crawler_id
-            })
+            report_error(crawler_id, e, task.get("task_id") if task else None, task.get("trace") if task else None)
             time.sleep(1)  # Prevent tight error loop
 
-def send_heartbeat(crawler_id):
+async def async_crawler_process(crawler_id, concurrency):
+    """Crawl with up to `concurrency` fetches in flight, honouring per-host politeness.
+
+    Fetching, parsing and queue calls are blocking, so each task runs in a
+    worker thread while the event loop schedules them.
+    """
+    logging.info(f"Crawler {crawler_id} started in async mode with concurrency {concurrency}")
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 4))
+
+    in_flight = set()
+    finished = []  # receipt handles of tasks whose results were sent
+
+    async def run_task(message, task, host_wait):
+        try:
+            with TASKS_IN_FLIGHT.track_in_progress():
+                with span(task.get("trace"), 'crawler.host_wait'):
+                    await asyncio.sleep(host_wait)
+                sent = await loop.run_in_executor(None, process_task, crawler_id, task, False)
+            if sent:
+                finished.append(message['ReceiptHandle'])
+        except Exception as e:
+            await loop.run_in_executor(None, report_error, crawler_id, e, task.get("task_id"), task.get("trace"))
+
     while True:
-        send_message(RESULT_QUEUE_NAME, {
+        try:
+            if finished:
+                done, finished[:] = list(finished), []
+                await loop.run_in_executor(None, delete_messages_batch, CRAWLER_QUEUE_NAME, done)
+
+            free_slots = concurrency - len(in_flight)
+            if free_slots <= 0:
+                _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            # Only long-poll when idle, so finished tasks are acknowledged promptly
+            wait_time = 1 if in_flight else 20
+            messages = await loop.run_in_executor(
+                None, receive_messages, CRAWLER_QUEUE_NAME, min(free_slots, MAX_BATCH_SIZE), wait_time
+            )
+            for message in messages:
+                task = await loop.run_in_executor(None, parse_task, crawler_id, message)
+                if task is None:
+                    continue
+                # Only start tasks whose host slot is near, so none outlives its message
+                # visibility or lease while waiting; the rest go back for a less busy crawler
+                host_wait = host_scheduler.reserve(task["url"], MAX_HOST_WAIT)
+                if host_wait is None:
+                    TASKS_DEFERRED.inc()
+                    await loop.run_in_executor(None, change_message_visibility, CRAWLER_QUEUE_NAME,
+                                               message['ReceiptHandle'], MAX_HOST_WAIT)
+                    continue
+                in_flight.add(asyncio.create_task(run_task(message, task, host_wait)))
+            in_flight = {t for t in in_flight if not t.done()}
+
+        except Exception as e:
+            await loop.run_in_executor(None, report_error, crawler_id, e)
+            await asyncio.sleep(1)  # Prevent tight error loop
+
+def send_heartbeat(crawler_id, capacity):
+    """Join the crawler fleet and stay in it; `capacity` is how many fetches this process runs at once"""
+    while True:
+        with progress_lock:
+            started = started_tasks[:]
+            started_tasks.clear()
+            crawled = pages_crawled
+        send_message(CONTROL_QUEUE_NAME, {
             "type": "heartbeat",
             "crawler_id": crawler_id,
-            "timestamp": time.time()
+            "timestamp": time.time(),
+            "capacity": capacity,
+            "pages_crawled": crawled,
+            "started": started
         })
-        time.sleep(3)  # Send every 3 seconds
+        time.sleep(HEARTBEAT_INTERVAL)
+
+def send_leave(crawler_id):
+    """Tell the master this crawler is shutting down so its tasks are reassigned at once"""
+    send_message(CONTROL_QUEUE_NAME, {"type": "leave", "crawler_id": crawler_id})
 
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python crawler_node.py <crawler_id>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Run a crawler node")
+    parser.add_argument("crawler_id", type=int)
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="fetch many URLs concurrently with asyncio")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum fetches in flight in async mode")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="port for the /metrics listener (default METRICS_PORT + crawler_id)")
+    args = parser.parse_args()
     
-    crawler_id = int(sys.argv[1])
+    crawler_id = args.crawler_id
+    set_service(f"crawler-{crawler_id}")
+    start_metrics_server(args.metrics_port or METRICS_PORT + crawler_id)
 
-    # Heartbeat thread
-    heartbeat_thread = threading.Thread(target=send_heartbeat, args=(crawler_id,))
+    # Heartbeat thread; the first heartbeat registers this crawler with the master
+    capacity = args.concurrency if args.use_async else 1
+    heartbeat_thread = threading.Thread(target=send_heartbeat, args=(crawler_id, capacity))
     heartbeat_thread.daemon = True
     heartbeat_thread.start()
 
-    crawler_process(crawler_id)
+    try:
+        if args.use_async:
+            asyncio.run(async_crawler_process(crawler_id, args.concurrency))
+        else:
+            crawler_process(crawler_id)
+    except KeyboardInterrupt:
+        logging.info(f"Crawler {crawler_id} stopping")
+    finally:
+        send_leave(crawler_id)
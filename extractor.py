@@ -0,0 +1,163 @@
+import re
+import logging
+from collections import namedtuple
+from html.parser import HTMLParser
+from url_canon import canonicalize_url
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Extraction configuration
+EXTRACTION_BACKEND = 'auto'  # 'lxml', 'html.parser', or 'auto' (lxml when installed)
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}  # text inside these is not page text
+
+# libxml2 drops CDATA sections and keeps markup inside <textarea> as literal text, where
+# BeautifulSoup keeps the CDATA text and parses the markup; pages with either use html.parser
+LXML_MISMATCH = re.compile(r'<!\[CDATA\[|<textarea', re.IGNORECASE)
+
+ExtractedPage = namedtuple('ExtractedPage', ['links', 'text', 'title', 'robots'])
+
+class _PageCollector:
+    """Parser target that gathers links, text, title and meta robots in one pass.
+
+    Text is gathered the way BeautifulSoup's get_text(separator=' ', strip=True)
+    does: each text node is stripped and the non-empty ones joined by spaces.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.hrefs = set()  # raw href values, canonicalized once each when parsing ends
+        self.strings = []
+        self.title = None
+        self.robots = set()
+        self._pending = []  # pieces of the current text node
+        self._skip_depth = 0
+        self._in_title = False
+        self._title_parts = []
+
+    def _flush_text(self):
+        if self._pending:
+            text = ''.join(self._pending).strip()
+            self._pending = []
+            if text:
+                self.strings.append(text)
+
+    def start(self, tag, attrs):
+        self._flush_text()
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'a':
+            href = attrs.get('href')
+            if href is not None:
+                self.hrefs.add(href)
+        elif tag == 'title' and self.title is None:
+            self._in_title = True
+        elif tag == 'meta' and (attrs.get('name') or '').lower() == 'robots':
+            content = attrs.get('content') or ''
+            self.robots.update(d.strip().lower() for d in content.split(',') if d.strip())
+
+    def end(self, tag):
+        self._flush_text()
+        if tag in SKIPPED_TEXT_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts).strip()
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        self._pending.append(text)
+        if self._in_title:
+            self._title_parts.append(text)
+
+    def comment(self, text):
+        self._flush_text()
+
+    def cdata(self, text):
+        # A CDATA section is a text node of its own
+        self._flush_text()
+        self.data(text)
+        self._flush_text()
+
+    def _links(self):
+        links = set()
+        for href in self.hrefs:
+            link = canonicalize_url(href, self.base_url)
+            # Canonical URLs have a lowercase scheme
+            if link and link.startswith(('http://', 'https://')):
+                links.add(link)
+        return list(links)
+
+    def close(self):
+        self._flush_text()
+        return ExtractedPage(self._links(), ' '.join(self.strings), self.title, self.robots)
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        # Later duplicate attributes win, as in BeautifulSoup
+        self.collector.start(tag, {name: value if value is not None else '' for name, value in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def handle_comment(self, data):
+        self.collector.comment(data)
+
+    def unknown_decl(self, data):
+        # CDATA sections count as text; other declarations do not
+        if data.upper().startswith('CDATA['):
+            self.collector.cdata(data[len('CDATA['):])
+
+def _extract_stdlib(html, base_url):
+    collector = _PageCollector(base_url)
+    parser = _StdlibParser(collector)
+    parser.feed(html)
+    parser.close()
+    return collector.close()
+
+def _extract_lxml(html, base_url):
+    """lxml extraction; the one remaining difference from BeautifulSoup is that with
+    duplicate attributes (e.g. two hrefs on one <a>) the first wins, as HTML specifies,
+    not the last"""
+    if LXML_MISMATCH.search(html):
+        return _extract_stdlib(html, base_url)
+    parser = etree.HTMLParser(target=_PageCollector(base_url))
+    parser.feed(html)
+    return parser.close()
+
+EXTRACTORS = {
+    'html.parser': _extract_stdlib,
+}
+if etree is not None:
+    EXTRACTORS['lxml'] = _extract_lxml
+
+def get_extractor(backend=EXTRACTION_BACKEND):
+    if backend == 'auto':
+        backend = 'lxml' if 'lxml' in EXTRACTORS else 'html.parser'
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Unknown or unavailable extraction backend: {backend}")
+    return EXTRACTORS[backend]
+
+def extract_page(html, base_url, backend=EXTRACTION_BACKEND):
+    """Parse a page once, returning its links, text, title and meta robots directives"""
+    extract = get_extractor(backend)
+    try:
+        return extract(html, base_url)
+    except Exception as e:
+        # lxml gives up on some inputs (e.g. empty documents); the stdlib parser never does
+        logging.debug(f"Falling back to html.parser for {base_url}: {e}")
+        return _extract_stdlib(html, base_url)
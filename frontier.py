@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import threading
+from urllib.parse import urlparse
+
+def url_host(url):
+    """Lowercased netloc of a URL; a plain slice for canonical URLs, which is much cheaper than urlparse"""
+    start = url.find('://')
+    if start < 0:
+        return urlparse(url).netloc.lower()
+    start += 3
+    end = len(url)
+    for separator in '/?#':
+        i = url.find(separator, start, end)
+        if i != -1:
+            end = i
+    return url[start:end].lower()
+
+# Scoring functions take (url, depth, inlinks) and return a score; lower scores are crawled first
+
+def bfs_score(url, depth, inlinks):
+    """Breadth-first: shallow pages first"""
+    return depth
+
+def link_count_score(url, depth, inlinks):
+    """Pages linked from many crawled pages first"""
+    return -inlinks
+
+def domain_priority_score(domains):
+    """Pages on domains listed earlier in `domains` first, e.g. ALLOWED_DOMAINS"""
+    def score(url, depth, inlinks):
+        host = url_host(url)
+        matches = [i for i, domain in enumerate(domains) if host == domain or host.endswith('.' + domain)]
+        return min(matches) if matches else len(domains)
+    return score
+
+def with_host_penalty(score_fn, penalty_for):
+    """Add `penalty_for(host)` to another strategy's score, e.g. to push back hosts serving duplicates"""
+    def score(url, depth, inlinks):
+        return score_fn(url, depth, inlinks) + penalty_for(url_host(url))
+    return score
+
+class Frontier:
+    """Priority frontier of URLs waiting to be crawled.
+
+    URLs are ordered by (score, depth, per-host position), so within the
+    same score and depth the frontier alternates between hosts instead of
+    draining one host at a time. Scores are recomputed when a queued URL
+    gains another inbound link.
+
+    Each host has its own heap, and a heap of hosts ordered by their best
+    URL picks the next one. Paused hosts, e.g. hosts with as many leases
+    as they may have, leave the host heap until they are resumed, so pop()
+    never walks past their URLs.
+    """
+
+    def __init__(self, score_fn=bfs_score):
+        self.score_fn = score_fn
+        self._host_heaps = {}  # host -> heap of (score, depth, host position, counter, url)
+        self._ready = []  # heap of (best item, host) for hosts that are not paused
+        self._ready_items = {}  # host -> its current item in _ready; older items there are stale
+        self._paused = set()
+        self._entries = {}  # url -> [score, depth, inlinks] for URLs still queued
+        self._host_counts = {}  # host -> URLs pushed so far, used to interleave hosts
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _is_stale(self, item):
+        entry = self._entries.get(item[4])
+        return entry is None or entry[0] != item[0]
+
+    def _schedule(self, host):
+        """Put a host in the host heap under its best live URL, dropping stale items above it"""
+        heap = self._host_heaps.get(host)
+        while heap and self._is_stale(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            self._host_heaps.pop(host, None)
+            self._ready_items.pop(host, None)
+            return
+        if host not in self._paused and self._ready_items.get(host) is not heap[0]:
+            self._ready_items[host] = heap[0]
+            heapq.heappush(self._ready, (heap[0], host))
+
+    def _push_entry(self, url, score, depth):
+        host = url_host(url)
+        host_position = self._host_counts.get(host, 0)
+        self._host_counts[host] = host_position + 1
+        item = (score, depth, host_position, next(self._counter), url)
+        heapq.heappush(self._host_heaps.setdefault(host, []), item)
+        ready_item = self._ready_items.get(host)
+        if host not in self._paused and (ready_item is None or item < ready_item):
+            self._ready_items[host] = item
+            heapq.heappush(self._ready, (item, host))
+
+    def push(self, url, depth, inlinks=1):
+        """Queue a URL, returning False if it is already queued"""
+        with self._lock:
+            if url in self._entries:
+                return False
+            score = self.score_fn(url, depth, inlinks)
+            self._entries[url] = [score, depth, inlinks]
+            self._push_entry(url, score, depth)
+            return True
+
+    def push_front(self, url, depth):
+        """Queue a URL ahead of everything else, e.g. a task being retried"""
+        with self._lock:
+            score = float('-inf')
+            entry = self._entries.get(url)
+            self._entries[url] = [score, depth, entry[2] if entry else 1]
+            self._push_entry(url, score, depth)
+
+    def bump(self, url):
+        """Record another inbound link to a queued URL and rescore it"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return False
+            entry[2] += 1
+            score = self.score_fn(url, entry[1], entry[2])
+            if score < entry[0]:
+                # The old heap entry becomes stale and is skipped when popped
+                entry[0] = score
+                self._push_entry(url, score, entry[1])
+            return True
+
+    def discard(self, url):
+        """Remove a queued URL, e.g. one leased before a restart"""
+        with self._lock:
+            return self._entries.pop(url, None) is not None
+
+    def pause_host(self, host):
+        """Stop popping a host's URLs until it is resumed; they stay queued"""
+        with self._lock:
+            # Its item in the host heap is dropped when it reaches the top
+            self._paused.add(host)
+            self._ready_items.pop(host, None)
+
+    def set_paused_hosts(self, hosts):
+        """Pause exactly `hosts`, resuming any other paused host"""
+        hosts = set(hosts)
+        with self._lock:
+            resumed = self._paused - hosts
+            for host in hosts - self._paused:
+                self._ready_items.pop(host, None)
+            self._paused = hosts
+            for host in resumed:
+                self._schedule(host)
+
+    def snapshot(self):
+        """Return the frontier's contents in a picklable form for load()"""
+        with self._lock:
+            # Stale heap entries (superseded by bump or push_front) are left out
+            heap = [item for host_heap in self._host_heaps.values() for item in host_heap
+                    if not self._is_stale(item)]
+            return {
+                "heap": heap,
+                "entries": {url: list(entry) for url, entry in self._entries.items()},
+                "host_counts": dict(self._host_counts),
+            }
+
+    def load(self, snapshot):
+        """Replace the contents with a snapshot() taken earlier; scores are not recomputed"""
+        with self._lock:
+            self._entries = snapshot["entries"]
+            self._host_counts = snapshot["host_counts"]
+            self._host_heaps = {}
+            for item in snapshot["heap"]:
+                self._host_heaps.setdefault(url_host(item[4]), []).append(item)
+            self._ready, self._ready_items = [], {}
+            for host, heap in list(self._host_heaps.items()):
+                heapq.heapify(heap)
+                self._schedule(host)
+            self._counter = itertools.count(max((item[3] for item in snapshot["heap"]), default=-1) + 1)
+
+    def pop(self):
+        """Remove and return the best (url, depth) of a host that is not paused, or None if there is none"""
+        with self._lock:
+            while self._ready:
+                item, host = heapq.heappop(self._ready)
+                if self._ready_items.get(host) is not item:
+                    continue  # superseded by a better URL, or the host was paused
+                del self._ready_items[host]
+                if self._is_stale(item):
+                    self._schedule(host)
+                    continue
+                heapq.heappop(self._host_heaps[host])
+                url = item[4]
+                depth = self._entries.pop(url)[1]
+                self._schedule(host)
+                return url, depth
+            return None
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
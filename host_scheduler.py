@@ -0,0 +1,63 @@
+import time
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+# Configuration
+MAX_TRACKED_HOSTS = 100000  # forget hosts that are idle once this many are tracked
+
+class HostScheduler:
+    """Per-host politeness: only delays a fetch if the same host was hit recently.
+
+    `crawl_delay_for` is an optional callable returning the robots.txt
+    Crawl-delay for a URL (or None), which overrides `default_delay` for
+    that host.
+    """
+
+    def __init__(self, default_delay, crawl_delay_for=None):
+        self.default_delay = default_delay
+        self.crawl_delay_for = crawl_delay_for
+        self._next_fetch_time = {}  # host -> earliest time the next request may start
+        self._lock = threading.Lock()
+
+    def delay_for(self, url):
+        if self.crawl_delay_for:
+            crawl_delay = self.crawl_delay_for(url)
+            if crawl_delay is not None:
+                return crawl_delay
+        return self.default_delay
+
+    def reserve(self, url, max_wait=None):
+        """Claim the next fetch slot for the URL's host and return how long to wait for it.
+
+        With `max_wait`, a slot further away than that is not claimed and
+        None is returned instead.
+        """
+        host = urlparse(url).netloc.lower()
+        delay = self.delay_for(url)
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_fetch_time.get(host, now))
+            if max_wait is not None and start - now > max_wait:
+                return None
+            self._next_fetch_time[host] = start + delay
+            if len(self._next_fetch_time) > MAX_TRACKED_HOSTS:
+                self._forget_idle_hosts(now)
+        return start - now
+
+    def _forget_idle_hosts(self, now):
+        for host, next_time in list(self._next_fetch_time.items()):
+            if next_time <= now:
+                del self._next_fetch_time[host]
+
+    def wait(self, url):
+        """Block until the URL's host may be fetched"""
+        wait_time = self.reserve(url)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    async def wait_async(self, url):
+        """Sleep in the event loop until the URL's host may be fetched"""
+        wait_time = self.reserve(url)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
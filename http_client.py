@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connection pool configuration
+MAX_HOST_SESSIONS = 1000  # hosts with an open session; the least recently used is closed beyond this
+POOL_CONNECTIONS = 4  # connection pools cached per session
+POOL_MAXSIZE = 16  # keep-alive connections kept per host, roughly the concurrent fetches to one host
+ACCEPT_ENCODING = "gzip, deflate"
+
+class HttpClient:
+    """Keep-alive HTTP sessions pooled per host.
+
+    Each host gets its own requests.Session so consecutive fetches from the
+    same host reuse connections, and fetches to different hosts never
+    contend for the same pool.
+    """
+
+    def __init__(self, user_agent, max_sessions=MAX_HOST_SESSIONS,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        self.user_agent = user_agent
+        self.max_sessions = max_sessions
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = OrderedDict()  # scheme://host -> Session
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            "User-Agent": self.user_agent,
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
+        })
+        return session
+
+    def session_for(self, url):
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc.lower()}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = self._new_session()
+                if len(self._sessions) > self.max_sessions:
+                    _, evicted = self._sessions.popitem(last=False)
+                    evicted.close()
+            else:
+                self._sessions.move_to_end(key)
+            return session
+
+    def get(self, url, etag=None, last_modified=None, **kwargs):
+        """GET a URL, sending If-None-Match / If-Modified-Since when validators are given"""
+        headers = dict(kwargs.pop('headers', None) or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return self.session_for(url).get(url, headers=headers, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
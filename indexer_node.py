@@ -2,10 +2,19 @@ import time
 import logging
 import os
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.index import create_in, open_dir
-from whoosh.qparser import QueryParser
-from sqs_utils import send_message, receive_messages, delete_message, INDEXER_QUEUE_NAME, RESULT_QUEUE_NAME
+from whoosh.writing import NO_MERGE, MERGE_SMALL, OPTIMIZE
+from search_service import SearchService
+from sharding import shard_queue_name
+from blob_store import load_content
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Histogram
+from tracing import set_service, span, record_span, mark_stage, stage_time
+from sqs_utils import send_message, receive_messages, delete_messages_batch, RESULT_QUEUE_NAME, CONTROL_QUEUE_NAME
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Indexer - %(levelname)s - %(message)s')
@@ -13,86 +22,307 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - Indexer - %(leveln
 # Paths
 INDEX_DIR = "index_dir"
 
+# Search API
+SEARCH_API_PORT = 5003  # port the master queries for searches; shard N listens on SEARCH_API_PORT + N
+
+# Indexing Configuration
+INDEX_BATCH_SIZE = 500  # documents per commit
+INDEX_FLUSH_INTERVAL = 5  # seconds before a partial batch is committed
+INDEX_PROCS = 1  # writer processes; more than 1 uses Whoosh's multiprocess writer
+INDEX_LIMIT_MB = 128  # memory per writer process for buffering postings
+INDEX_MERGE_POLICY = 'small'  # segment merging in the background: 'none', 'small' or 'optimize'
+INDEX_MERGE_INTERVAL = 60  # seconds between background merges
+BLOB_FETCH_THREADS = 16  # parallel reads of claim-checked content from the blob store
+MAX_CONTENT_LOAD_ATTEMPTS = 5  # failed blob reads before a message is dropped instead of retried
+
+MERGE_POLICIES = {
+    'none': None,
+    'small': MERGE_SMALL,
+    'optimize': OPTIMIZE,
+}
+
 # Create schema
 schema = Schema(
     url=ID(stored=True, unique=True),
     content=TEXT
 )
 
-def init_index():
-    if not os.path.exists(INDEX_DIR):
-        os.mkdir(INDEX_DIR)
-        ix = create_in(INDEX_DIR, schema)
-        logging.info("Created new index.")
+def init_index(index_dir=INDEX_DIR):
+    if not os.path.exists(index_dir):
+        os.mkdir(index_dir)
+        ix = create_in(index_dir, schema)
+        logging.info(f"Created new index in {index_dir}.")
     else:
-        ix = open_dir(INDEX_DIR)
-        logging.info("Opened existing index.")
+        ix = open_dir(index_dir)
+        logging.info(f"Opened existing index in {index_dir}.")
     return ix
 
-def index_content(ix, url, content):
-    try:
-        writer = ix.writer()
-        writer.update_document(url=url, content=content)
-        writer.commit()
-        logging.info(f"Indexed: {url}")
-    except Exception as e:
-        logging.error(f"Error indexing {url}: {e}")
+# Metrics
+COMMIT_SECONDS = Histogram('indexer_commit_seconds', 'Time to commit one batch of documents')
+MERGE_SECONDS = Histogram('indexer_merge_seconds', 'Time to merge index segments', buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+DOCUMENTS = Counter('indexer_documents_total', 'Documents committed to the index')
+DROPPED_DOCUMENTS = Counter('indexer_dropped_documents_total', 'Documents dropped because their content could not be read')
+COMMIT_ERRORS = Counter('indexer_commit_errors_total', 'Batches that failed to commit')
+SEARCH_SECONDS = Histogram('indexer_search_seconds', 'Time to answer a search request')
+
+class BufferedIndexer:
+    """Buffers documents and commits them in batches.
+
+    Commits never merge segments, so they stay fast; a background thread
+    merges segments every INDEX_MERGE_INTERVAL seconds according to
+    INDEX_MERGE_POLICY. Receipt handles are returned from flush() only
+    once their documents are committed, so messages are acknowledged
+    after they are durable.
+    """
+
+    def __init__(self, ix, batch_size=INDEX_BATCH_SIZE, flush_interval=INDEX_FLUSH_INTERVAL,
+                 procs=INDEX_PROCS, merge_policy=INDEX_MERGE_POLICY, on_commit=None):
+        self.ix = ix
+        self.on_commit = on_commit  # called after every commit or merge
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.procs = procs
+        self.mergetype = MERGE_POLICIES[merge_policy]
+        self._pending = {}  # url -> content, so repeated URLs in a batch are indexed once
+        self._receipts = []
+        self._traces = []  # sampled traces of buffered documents, closed when they are committed
+        self._first_pending = None
+        self._writer_lock = threading.Lock()  # Whoosh allows one writer at a time
+        self._started = time.time()
+        self.docs_indexed = 0
+
+        if self.mergetype is not None:
+            merge_thread = threading.Thread(target=self._merge_loop)
+            merge_thread.daemon = True
+            merge_thread.start()
+
+    def add(self, url, content, receipt_handle=None, trace=None):
+        if not self._pending:
+            self._first_pending = time.time()
+        self._pending[url] = content
+        if receipt_handle:
+            self._receipts.append(receipt_handle)
+        if trace and trace.get("sampled"):
+            self._traces.append((url, trace))
+
+    def should_flush(self):
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.batch_size or
+                time.time() - (self._first_pending or 0) >= self.flush_interval)
+
+    def _writer(self):
+        if self.procs > 1:
+            return self.ix.writer(procs=self.procs, limitmb=INDEX_LIMIT_MB, multisegment=True)
+        return self.ix.writer(limitmb=INDEX_LIMIT_MB)
+
+    def flush(self):
+        """Commit buffered documents, returning the receipt handles that are now safe to delete"""
+        docs, receipts, traces = self._pending, self._receipts, self._traces
+        self._pending, self._receipts, self._traces, self._first_pending = {}, [], [], None
+        if not docs:
+            return receipts
+
+        start = time.time()
+        try:
+            with self._writer_lock:
+                writer = self._writer()
+                try:
+                    for url, content in docs.items():
+                        writer.update_document(url=url, content=content)
+                    writer.commit(mergetype=NO_MERGE)
+                except Exception:
+                    writer.cancel()
+                    raise
+        except Exception as e:
+            # Leave the messages on the queue so they are retried
+            COMMIT_ERRORS.inc()
+            logging.error(f"Error committing batch of {len(docs)} documents: {e}")
+            return []
+
+        if self.on_commit:
+            self.on_commit()
+
+        # Indexing covers buffering as well as the commit
+        for url, trace in traces:
+            record_span(trace, 'indexer.index', stage_time(trace, "index_received"), batch_size=len(docs))
+            record_span(trace, 'crawl', stage_time(trace, "leased"), root=True, url=url, indexed=True)
+
+        elapsed = max(time.time() - start, 1e-6)
+        COMMIT_SECONDS.observe(elapsed)
+        DOCUMENTS.inc(len(docs))
+        self.docs_indexed += len(docs)
+        overall_rate = self.docs_indexed / max(time.time() - self._started, 1e-6)
+        logging.info(f"Indexed {len(docs)} documents in {elapsed:.2f}s "
+                     f"({len(docs) / elapsed:.0f} docs/sec, {overall_rate:.1f} docs/sec overall, "
+                     f"{self.docs_indexed} total)")
+        return receipts
 
-def search_index(ix, query_str):
+    def merge(self):
+        start = time.time()
+        with self._writer_lock:
+            writer = self.ix.writer(limitmb=INDEX_LIMIT_MB)
+            writer.commit(mergetype=self.mergetype)
+        if self.on_commit:
+            self.on_commit()
+        MERGE_SECONDS.observe(time.time() - start)
+        logging.info(f"Merged index segments in {time.time() - start:.2f}s")
+
+    def _merge_loop(self):
+        while True:
+            time.sleep(INDEX_MERGE_INTERVAL)
+            try:
+                self.merge()
+            except Exception as e:
+                logging.error(f"Error merging index segments: {e}")
+
+# Search API served directly to the master
+app = Flask(__name__)
+search_service = None
+
+@app.route('/search', methods=['GET', 'POST'])
+def search():
+    # A POST carries collection-wide term statistics from a scatter-gather search
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+    else:
+        data = request.args
+    query = data.get('q')
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    limit = int(data.get('limit') or search_service.limit)
+    with SEARCH_SECONDS.time():
+        results = search_service.search(query, limit, data.get('stats'))
+    return jsonify(results), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+@app.route('/term_stats', methods=['GET'])
+def term_stats():
+    query = request.args.get('q')
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    return jsonify(search_service.term_stats(query)), 200
+
+def start_search_api(service, port=SEARCH_API_PORT):
+    global search_service
+    search_service = service
+    api_thread = threading.Thread(target=app.run, kwargs={"host": "0.0.0.0", "port": port, "threaded": True})
+    api_thread.daemon = True
+    api_thread.start()
+    logging.info(f"Search API listening on port {port}")
+
+def fetch_content(content_hash, trace=None):
     try:
-        with ix.searcher() as searcher:
-            query = QueryParser("content", ix.schema).parse(query_str)
-            results = searcher.search(query, limit=10)
-            return [(r['url'], r.score) for r in results]
+        with span(trace, 'indexer.load_content'):
+            return load_content(content_hash)
     except Exception as e:
-        logging.error(f"Error searching: {e}")
-        return []
+        logging.error(f"Failed to load content {content_hash} from the blob store: {e}")
+        return None
 
-def indexer_process():
-    logging.info("Indexer started")
-    ix = init_index()
+def indexer_process(shard=0, num_shards=1):
+    logging.info(f"Indexer started for shard {shard} of {num_shards}")
+    index_dir = INDEX_DIR if num_shards <= 1 else f"{INDEX_DIR}_shard{shard}"
+    queue_name = shard_queue_name(shard, num_shards)
+    ix = init_index(index_dir)
+    searcher = SearchService(ix)
+    indexer = BufferedIndexer(ix, on_commit=searcher.mark_stale)
+    start_search_api(searcher, SEARCH_API_PORT + shard)
+    blob_pool = ThreadPoolExecutor(max_workers=BLOB_FETCH_THREADS)
+    load_failures = {}  # content hash -> failed reads so far
 
     while True:
         try:
-            messages = receive_messages(INDEXER_QUEUE_NAME)
-            if not messages:
-                time.sleep(1)
-                continue
-                
-            message = messages[0]
-            try:
-                body = json.loads(message['Body'])
-                logging.info(f"Received message: {json.dumps(body)}")
-            except json.JSONDecodeError:
-                logging.error("Failed to decode message body")
-                delete_message(INDEXER_QUEUE_NAME, message['ReceiptHandle'])
-                continue
-
-            if body.get("type") == "search":
-                query = body.get("query")
-                if query:
-                    results = search_index(ix, query)
-                    send_message(RESULT_QUEUE_NAME, {
-                        "type": "search_result",
-                        "results": results
-                    })
-                delete_message(INDEXER_QUEUE_NAME, message['ReceiptHandle'])
-                continue
-
-            url = body.get("url")
-            content = body.get("content")
-
-            if url and content:
-                index_content(ix, url, content)
-            else:
-                logging.warning(f"Missing data in message: {body}")
-
-            # Delete processed message
-            delete_message(INDEXER_QUEUE_NAME, message['ReceiptHandle'])
+            # Poll no longer than the flush interval so partial batches are committed on time
+            messages = receive_messages(queue_name, wait_time=min(20, indexer.flush_interval))
+
+            processed = []
+            claims = []  # (url, content hash, receipt handle, trace) for content in the blob store
+            for message in messages:
+                try:
+                    body = json.loads(message['Body'])
+                    logging.debug(f"Received message: {json.dumps(body)}")
+                except json.JSONDecodeError:
+                    logging.error("Failed to decode message body")
+                    processed.append(message['ReceiptHandle'])
+                    continue
+
+                if body.get("type") == "search":
+                    # Fallback for masters that cannot reach the search API
+                    query = body.get("query")
+                    if query:
+                        results = searcher.search(query, body.get("limit"), body.get("stats"))
+                        send_message(body.get("reply_queue", RESULT_QUEUE_NAME), {
+                            "type": "search_result",
+                            "correlation_id": body.get("correlation_id"),
+                            "results": results
+                        })
+                    processed.append(message['ReceiptHandle'])
+                    continue
+
+                if body.get("type") == "term_stats":
+                    # First step of a sharded search over the queue, like GET /term_stats
+                    query = body.get("query")
+                    if query:
+                        send_message(body.get("reply_queue", RESULT_QUEUE_NAME), {
+                            "type": "term_stats_result",
+                            "correlation_id": body.get("correlation_id"),
+                            "stats": searcher.term_stats(query)
+                        })
+                    processed.append(message['ReceiptHandle'])
+                    continue
+
+                url = body.get("url")
+                content = body.get("content")
+                trace = body.get("trace")
+                record_span(trace, 'indexer.queue_wait', stage_time(trace, "forwarded"))
+                mark_stage(trace, "index_received")
+
+                if url and body.get("content_hash"):
+                    claims.append((url, body["content_hash"], message['ReceiptHandle'], trace))
+                elif url and content:
+                    # Deleted once the batch containing it is committed
+                    indexer.add(url, content, message['ReceiptHandle'], trace)
+                else:
+                    logging.warning(f"Missing data in message: {body}")
+                    processed.append(message['ReceiptHandle'])
+
+            # Read claim-checked content in parallel; failed reads stay on the queue for a retry,
+            # up to MAX_CONTENT_LOAD_ATTEMPTS (e.g. the blob store is not shared with this machine)
+            contents = blob_pool.map(fetch_content, [content_hash for _, content_hash, _, _ in claims],
+                                     [trace for _, _, _, trace in claims])
+            for (url, content_hash, receipt_handle, trace), content in zip(claims, contents):
+                if content:
+                    load_failures.pop(content_hash, None)
+                    indexer.add(url, content, receipt_handle, trace)
+                    continue
+                load_failures[content_hash] = load_failures.get(content_hash, 0) + 1
+                if load_failures[content_hash] >= MAX_CONTENT_LOAD_ATTEMPTS:
+                    logging.error(f"Dropping {url}: content {content_hash} could not be read after "
+                                  f"{MAX_CONTENT_LOAD_ATTEMPTS} attempts; is BLOB_DIR shared with the crawlers?")
+                    DROPPED_DOCUMENTS.inc()
+                    load_failures.pop(content_hash)
+                    processed.append(receipt_handle)
+                    # Tell the master, so it forgets the page's validators and refetches it in full
+                    send_message(CONTROL_QUEUE_NAME, {"type": "index_dropped", "url": url})
+
+            if indexer.should_flush():
+                processed.extend(indexer.flush())
+
+            # Delete processed messages
+            delete_messages_batch(queue_name, processed)
 
         except Exception as e:
             logging.error(f"Indexer encountered an error: {e}")
             time.sleep(1)  # Add delay before retrying
 
 if __name__ == '__main__':
-    indexer_process()
+    parser = argparse.ArgumentParser(description="Run an indexer node")
+    parser.add_argument("--shard", type=int, default=0, help="shard owned by this indexer")
+    parser.add_argument("--num-shards", type=int, default=1, help="total number of index shards")
+    args = parser.parse_args()
+
+    set_service(f"indexer-{args.shard}")
+    indexer_process(args.shard, args.num_shards)
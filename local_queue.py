@@ -0,0 +1,149 @@
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+# Logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - LocalQueue - %(levelname)s - %(message)s')
+
+# Configuration
+DEFAULT_VISIBILITY_TIMEOUT = 30  # seconds a received message stays hidden
+POLL_INTERVAL = 0.05  # seconds between polls while long-polling an empty queue
+
+class LocalQueueBackend:
+    """SQLite (WAL mode) backed queue with SQS-like visibility timeouts.
+
+    Every process on the box opens the same database file, so the master,
+    crawlers and indexer can talk to each other without AWS. Messages are
+    returned in the same shape as SQS (`MessageId`, `ReceiptHandle`, `Body`).
+    """
+
+    def __init__(self, path, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                body TEXT NOT NULL,
+                visible_at REAL NOT NULL,
+                receipt TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_visible ON messages (queue, visible_at, id)")
+        conn.commit()
+        logging.info(f"Using local queue database at {path}")
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_queue_url(self, queue_name):
+        return f"sqlite:///{self.path}#{queue_name}"
+
+    def send_message(self, queue_name, body):
+        conn = self._conn()
+        cursor = conn.execute(
+            "INSERT INTO messages (queue, body, visible_at) VALUES (?, ?, ?)",
+            (queue_name, body, time.time())
+        )
+        return str(cursor.lastrowid)
+
+    def send_messages(self, queue_name, bodies):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            message_ids = []
+            for body in bodies:
+                cursor = conn.execute(
+                    "INSERT INTO messages (queue, body, visible_at) VALUES (?, ?, ?)",
+                    (queue_name, body, now)
+                )
+                message_ids.append(str(cursor.lastrowid))
+            conn.execute("COMMIT")
+            return message_ids
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _claim(self, queue_name, max_messages):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Oldest visible first; this order is the (queue, visible_at, id) index's, so nothing is sorted
+            rows = conn.execute(
+                "SELECT id, body FROM messages WHERE queue = ? AND visible_at <= ? ORDER BY visible_at, id LIMIT ?",
+                (queue_name, now, max_messages)
+            ).fetchall()
+            messages = []
+            for message_id, body in rows:
+                receipt = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE messages SET visible_at = ?, receipt = ? WHERE id = ?",
+                    (now + self.visibility_timeout, receipt, message_id)
+                )
+                messages.append({
+                    'MessageId': str(message_id),
+                    'ReceiptHandle': f"{message_id}:{receipt}",
+                    'Body': body
+                })
+            conn.execute("COMMIT")
+            return messages
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def receive_messages(self, queue_name, max_messages=10, wait_time=20):
+        deadline = time.time() + wait_time
+        while True:
+            messages = self._claim(queue_name, max_messages)
+            if messages or time.time() >= deadline:
+                return messages
+            time.sleep(POLL_INTERVAL)
+
+    def change_message_visibility(self, queue_name, receipt_handle, visibility_timeout):
+        message_id, receipt = receipt_handle.split(':', 1)
+        self._conn().execute(
+            "UPDATE messages SET visible_at = ? WHERE id = ? AND queue = ? AND receipt = ?",
+            (time.time() + visibility_timeout, int(message_id), queue_name, receipt)
+        )
+
+    def delete_message(self, queue_name, receipt_handle):
+        message_id, receipt = receipt_handle.split(':', 1)
+        self._conn().execute(
+            "DELETE FROM messages WHERE id = ? AND queue = ? AND receipt = ?",
+            (int(message_id), queue_name, receipt)
+        )
+
+    def delete_messages(self, queue_name, receipt_handles):
+        rows = []
+        for receipt_handle in receipt_handles:
+            message_id, receipt = receipt_handle.split(':', 1)
+            rows.append((int(message_id), queue_name, receipt))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = 0
+            for row in rows:
+                deleted += conn.execute(
+                    "DELETE FROM messages WHERE id = ? AND queue = ? AND receipt = ?", row
+                ).rowcount
+            conn.execute("COMMIT")
+            return deleted
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge_queue(self, queue_name):
+        self._conn().execute("DELETE FROM messages WHERE queue = ?", (queue_name,))
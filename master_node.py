@@ -1,22 +1,59 @@
+import os
+import math
 import time
+import uuid
+import queue
 import logging
 import json
-from collections import deque
-from flask import Flask, request, jsonify
+import requests
+from flask import Flask, Response, request, jsonify
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from sqs_utils import send_message, receive_messages, delete_message, CRAWLER_QUEUE_NAME, INDEXER_QUEUE_NAME, RESULT_QUEUE_NAME
-from clear_queues import get_queue_url, purge_queue, get_sqs_client
+from frontier import Frontier, url_host, bfs_score, link_count_score, domain_priority_score, with_host_penalty
+from near_dup import SimHashIndex
+from seen_set import create_seen_set, save_seen_set
+from checkpoint import Journal, save_snapshot, load_checkpoint
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram
+from tracing import new_trace, set_service, span, record_span, mark_stage, stage_time
+from sharding import shard_for_url, shard_queue_name, merge_term_stats, merge_results
+from url_canon import canonicalize_url
+from sqs_utils import send_message, send_messages_batch, receive_messages, delete_messages_batch, CRAWLER_QUEUE_NAME, RESULT_QUEUE_NAME, SEARCH_REPLY_QUEUE_NAME, CONTROL_QUEUE_NAME
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Master - %(levelname)s - %(message)s')
 
 # Configuration
 CRAWL_TIMEOUT = 10  # seconds before assuming crawler is unresponsive
-NUM_CRAWLERS = 2  # number of crawler processes
+TASKS_PER_SLOT = 2  # leased tasks kept per crawler fetch slot so none sits idle between tasks
+TASK_LEASE_TIMEOUT = 60  # seconds a task may stay unfinished before it is reassigned
+MAX_LEASES_PER_HOST = 10  # outstanding leases per host; at the default 1 s crawl delay one crawler starts them all within its MAX_HOST_WAIT
 MAX_CRAWL_DEPTH = 3  # maximum depth for crawling
 MAX_RETRIES = 3  # maximum retries for a URL
 RETRY_DELAY = 5  # seconds before retrying a failed URL
+INDEXER_URLS = [  # search API of each index shard, in shard order
+    "http://localhost:5003",
+]
+SEARCH_TIMEOUT = 5  # seconds to wait for the indexer search API
+SEARCH_LIMIT = 10  # results returned per search
+QUEUE_SEARCH_TIMEOUT = 30  # seconds to wait for a search sent over the queue
+FRONTIER_SCORING = 'bfs'  # 'bfs', 'link_count' or 'domain_priority'
+SEEN_SET_TYPE = 'hash'  # 'hash' (exact) or 'bloom' (scalable, for very large crawls)
+SEEN_SET_PATH = None  # file to persist seen URLs to, e.g. 'seen_urls.pkl'
+SEEN_SET_SAVE_INTERVAL = 60  # seconds between saves of the seen set
+CHECKPOINT_DIR = None  # directory for state snapshots and the mutation journal, e.g. 'master_checkpoint'
+CHECKPOINT_INTERVAL = 300  # seconds between snapshots; the journal covers changes in between
+JOURNAL_FLUSH_INTERVAL = 1  # seconds between journal flushes
+AUTOSCALE_DRAIN_TIME = 600  # seconds the crawler fleet should need to work through the frontier
+AUTOSCALE_MIN_CRAWLERS = 1
+AUTOSCALE_MAX_CRAWLERS = 50
+THROUGHPUT_SMOOTHING = 0.3  # weight of the newest heartbeat in each crawler's pages/s average
+RESULT_RECEIVERS = 2  # threads long-polling the result queue
+RESULT_WORKERS = 4  # threads processing received result batches
+RESULT_BACKLOG = 16  # received batches waiting for a worker before receivers pause
+SKIP_NEAR_DUPLICATES = True  # don't index pages whose text nearly matches an indexed page
+DUPLICATE_HOST_PENALTY = 2  # frontier score added for a host serving only duplicates, scaled by its duplicate ratio
+DUPLICATE_HOST_MIN_PAGES = 5  # pages seen from a host before it can be penalised
 
 ALLOWED_DOMAINS = [
     # Python-related domains
@@ -50,6 +87,9 @@ ALLOWED_DOMAINS = [
     'forum.djangoproject.com',
     'forum.flask.pocoo.org'
 ]
+if os.environ.get('ALLOWED_DOMAINS'):
+    # Comma-separated replacement for the list above, e.g. to crawl a local test site
+    ALLOWED_DOMAINS = os.environ['ALLOWED_DOMAINS'].split(',')
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -66,12 +106,68 @@ stats = {
     "average_links_per_page": 0,
     "domains_crawled": set(),
     "crawl_depth": {0: 0, 1: 0, 2: 0, 3: 0},
-    "urls_in_progress": set()
+    "urls_in_progress": set(),
+    "near_duplicates": 0,
+    "not_modified": 0
+}
+
+# Frontier scoring strategies; lower scores are crawled first
+SCORING_FUNCTIONS = {
+    'bfs': bfs_score,
+    'link_count': link_count_score,
+    'domain_priority': domain_priority_score(ALLOWED_DOMAINS),
 }
 
+# ETag / Last-Modified from each page's last fetch, sent with recrawls as conditional headers. Only pages
+# forwarded to the indexer keep them, so a page that never reached the index is fetched in full next time.
+page_validators = {}  # url -> {"etag": ..., "last_modified": ...}
+
+# Near-duplicate detection
+near_duplicates = SimHashIndex()
+host_duplicates = {}  # host -> [pages fingerprinted, near-duplicates found]
+
+def duplicate_host_penalty(host):
+    """Frontier penalty for hosts whose pages are mostly near-duplicates, e.g. mirrors"""
+    # Runs under the frontier's lock, so it reads without taking state_lock
+    pages, duplicates = host_duplicates.get(host, (0, 0))
+    if pages < DUPLICATE_HOST_MIN_PAGES:
+        return 0
+    return DUPLICATE_HOST_PENALTY * duplicates / pages
+
 # Initialize crawl queue
-crawl_queue = deque()
-tasks_in_progress = {}
+crawl_queue = Frontier(with_host_penalty(SCORING_FUNCTIONS[FRONTIER_SCORING], duplicate_host_penalty))
+tasks_in_progress = {}  # task_id -> lease details
+
+# Guards stats, tasks_in_progress, crawlers, page_validators and host_duplicates; the frontier,
+# seen set and near-duplicate index have their own locks. Take this one first if both are needed.
+# Frontier pushes and leases are journaled under it, so the journal replays them in the order they happened.
+state_lock = threading.Lock()
+
+# Batches of result messages waiting for a result worker
+result_batches = queue.Queue(maxsize=RESULT_BACKLOG)
+crawlers = {}  # crawler_id -> {"joined", "last_seen", "capacity", "pages_crawled", "throughput"} for live crawlers
+
+# Searches sent over the queue, waiting for their reply
+pending_searches = {}  # correlation_id -> {"event": Event, "results": list, "remaining": int}
+
+# Fans searches out to all index shards in parallel
+search_pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(INDEXER_URLS)))
+
+# Every URL ever queued, in progress or crawled
+seen_urls = create_seen_set(SEEN_SET_TYPE, SEEN_SET_PATH)
+
+# Frontier and lease changes since the last snapshot, replayed after a restart
+journal = Journal()
+
+# Metrics
+RESULTS = Counter('master_results_total', 'Crawler results processed', ['outcome'])
+RESULT_BATCH_SECONDS = Histogram('master_result_batch_seconds', 'Time to process one batch of result messages')
+SEARCH_SECONDS = Histogram('master_search_seconds', 'Time to answer a search request', ['path'])
+Gauge('master_frontier_size', 'URLs waiting in the frontier').set_function(lambda: len(crawl_queue))
+Gauge('master_tasks_in_flight', 'Tasks leased to crawlers and not yet finished').set_function(lambda: len(tasks_in_progress))
+Gauge('master_active_crawlers', 'Crawlers that sent a heartbeat recently').set_function(lambda: len(crawlers))
+Gauge('master_urls_seen', 'URLs in the seen set').set_function(lambda: len(seen_urls))
+Gauge('master_result_backlog', 'Received result batches waiting for a worker').set_function(lambda: result_batches.qsize())
 
 def is_allowed_domain(url):
     """Check if the URL belongs to an allowed domain"""
@@ -89,155 +185,451 @@ def is_html_url(url):
     except:
         return False
 
-def process_results():
-    """Process results from crawlers"""
+def handle_control(message):
+    """Track crawler membership from heartbeats and record which crawler picked up each task"""
+    if message.get("type") == "index_dropped":
+        # The indexer gave up on this page, so its next crawl must not be answered with a 304
+        with state_lock:
+            page_validators.pop(message.get("url"), None)
+        logging.info(f"Indexer dropped {message.get('url')}; its next crawl is unconditional")
+        return
+
+    crawler_id = message.get("crawler_id")
+    if crawler_id is None:
+        logging.error(f"Control message without crawler_id: {message}")
+        return
+
+    now = time.time()
+    if message.get("type") == "leave":
+        with state_lock:
+            crawlers.pop(crawler_id, None)
+            # Its unfinished tasks are reassigned on the next scheduling pass
+            for task in tasks_in_progress.values():
+                if task["crawler_id"] == crawler_id:
+                    task["start_time"] = 0
+        logging.info(f"Crawler {crawler_id} left")
+        return
+
+    if message.get("type") != "heartbeat":
+        logging.error(f"Invalid control message: {message}")
+        return
+
+    pages_crawled = message.get("pages_crawled", 0)
+    with state_lock:
+        node = crawlers.get(crawler_id)
+        if node is None:
+            node = crawlers[crawler_id] = {"joined": now, "last_seen": now, "pages_crawled": pages_crawled,
+                                           "throughput": 0.0}
+            logging.info(f"Crawler {crawler_id} joined with capacity {message.get('capacity', 1)}")
+        else:
+            elapsed = now - node["last_seen"]
+            crawled = pages_crawled - node["pages_crawled"]
+            if elapsed > 0 and crawled >= 0:
+                node["throughput"] += THROUGHPUT_SMOOTHING * (crawled / elapsed - node["throughput"])
+            node["last_seen"] = now
+            node["pages_crawled"] = pages_crawled
+        node["capacity"] = max(1, message.get("capacity", 1))
+
+        for task_id in message.get("started", []):
+            task = tasks_in_progress.get(task_id)
+            if task:
+                task["crawler_id"] = crawler_id
+    logging.info(f"Heart beat from crawler {crawler_id} recieved!")
+
+def autoscale_signal():
+    """Crawler count needed to work through the frontier in AUTOSCALE_DRAIN_TIME, for an external scaler"""
+    with state_lock:
+        active = len(crawlers)
+        capacity = sum(node["capacity"] for node in crawlers.values())
+        throughput = sum(node["throughput"] for node in crawlers.values())
+    backlog = len(crawl_queue)
+
+    if active and throughput > 0:
+        needed = math.ceil(backlog / (throughput / active * AUTOSCALE_DRAIN_TIME))
+    else:
+        # No throughput measured yet; ask for one crawler if there is anything to crawl
+        needed = max(active, 1 if backlog else 0)
+    desired = min(AUTOSCALE_MAX_CRAWLERS, max(AUTOSCALE_MIN_CRAWLERS, needed))
+
+    return {
+        "active_crawlers": active,
+        "crawler_capacity": capacity,
+        "frontier_size": backlog,
+        "pages_per_second": round(throughput, 3),
+        "pages_per_second_per_crawler": round(throughput / active, 3) if active else 0,
+        "desired_crawlers": desired,
+    }
+
+def process_control():
+    """Process heartbeats from the control queue"""
     while True:
-        messages = receive_messages(RESULT_QUEUE_NAME)
+        messages = receive_messages(CONTROL_QUEUE_NAME)
         for message in messages:
             try:
-                result = json.loads(message['Body'])
-                
-                if not isinstance(result, dict):
-                    logging.error(f"Invalid result format: {result}")
-                    delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                    continue
-                
-                # Heartbeat processing
-                if result.get("type") == "heartbeat":
-                    crawler_id = result["crawler_id"]
-                    if crawler_id in tasks_in_progress:
-                        tasks_in_progress[crawler_id]["last_heartbeat"] = time.time()
-                        logging.info(f"Heart beat from crawler {crawler_id} recieved!")
-                    continue
-                
-                if "error" in result:
-                    crawler_id = result.get("crawler_id")
-                    if crawler_id:
-                        logging.warning(f"Error from crawler {crawler_id}: {result['error']}")
-                        tasks_in_progress.pop(crawler_id, None)
-                        stats["failed_urls"] += 1
-                    else:
-                        logging.error("Error message without crawler_id")
-                    continue
-
-                if "status" in result:
-                    crawler_id = result.get("crawler_id")
-                    if crawler_id:
-                        logging.info(f"Status from crawler {crawler_id}: {result['status']}")
-                    else:
-                        logging.error("Status message without crawler_id")
-                    continue
-
-                # Process crawl result
-                url = result.get("url")
-                if not url:
-                    logging.error("Missing URL in result")
-                    delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                    continue
-
-                extracted_urls = result.get("extracted_urls", [])
-                if not isinstance(extracted_urls, list):
-                    extracted_urls = []
-                    
-                content = result.get("content", "")
-                crawler_id = result.get("crawler_id")
-                depth = result.get("depth", 0)
-
-                logging.info(f"Received result from crawler {crawler_id} for {url} - {len(extracted_urls)} new URLs")
-                stats["urls_crawled"] += 1
-                stats["total_links_found"] += len(extracted_urls)
-                if stats["urls_crawled"] > 0:
-                    stats["average_links_per_page"] = stats["total_links_found"] / stats["urls_crawled"]
-                
-                # Track domain statistics
-                try:
-                    domain = urlparse(url).netloc
-                    stats["domains_crawled"].add(domain)
-                except Exception as e:
-                    logging.error(f"Error parsing domain from URL {url}: {str(e)}")
-                
-                # Track depth statistics
-                if depth not in stats["crawl_depth"]:
-                    stats["crawl_depth"][depth] = 0
-                stats["crawl_depth"][depth] += 1
-
-                # Remove URL from in-progress set
-                stats["urls_in_progress"].discard(url)
-
-                # Add new URLs to queue (with filtering)
-                for new_url in extracted_urls:
-                    if (is_allowed_domain(new_url) and is_html_url(new_url) and 
-                        new_url not in crawl_queue and new_url not in stats["urls_in_progress"] and
-                        depth < MAX_CRAWL_DEPTH):
-                        crawl_queue.append(new_url)
-                        stats["urls_in_queue"] += 1
-                    else:
-                        stats["filtered_urls"] += 1
-
-                # Send content to indexer
-                if content:
-                    try:
-                        send_message(INDEXER_QUEUE_NAME, {"url": url, "content": content})
-                        stats["urls_indexed"] += 1
-                    except Exception as e:
-                        logging.error(f"Failed to send content to indexer: {str(e)}")
-
-                # Mark task as done
-                if crawler_id:
-                    tasks_in_progress.pop(crawler_id, None)
-
-                # Delete processed message
-                delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-
+                handle_control(json.loads(message['Body']))
             except Exception as e:
-                logging.error(f"Error processing result: {str(e)}")
-                try:
-                    delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                except:
-                    pass
+                logging.error(f"Error processing control message: {e}")
+        delete_messages_batch(CONTROL_QUEUE_NAME, [message['ReceiptHandle'] for message in messages])
+
+def claim_late_result(url):
+    """Decide what to do with a result that arrived after its lease expired.
+
+    The URL was requeued, so another copy is either still in the frontier or
+    leased again. That copy is dropped and the late result is used (True).
+    If the other copy has already been reported, the late result is a
+    duplicate (False). Caller holds state_lock.
+    """
+    if crawl_queue.discard(url):
+        journal.record("discard", url)
+        stats["urls_in_queue"] -= 1
+        return True
+    for task_id, task in list(tasks_in_progress.items()):
+        if task["url"] == url:
+            # Its crawler's result will find no lease and no queued copy, and be dropped
+            del tasks_in_progress[task_id]
+            journal.record("done", task_id)
+            return True
+    return False
+
+def handle_result(result):
+    """Apply one crawl result or error to the master's state, returning a document to index or None"""
+    if "error" in result:
+        crawler_id = result.get("crawler_id")
+        with state_lock:
+            task = tasks_in_progress.pop(result.get("task_id"), None)
+            if task:
+                stats["urls_in_progress"].discard(task["url"])
+                stats["failed_urls"] += 1
+        RESULTS.inc(outcome='error')
+        if task:
+            journal.record("done", result.get("task_id"))
+            logging.warning(f"Error from crawler {crawler_id} on {task['url']}: {result['error']}")
+        elif crawler_id:
+            logging.warning(f"Error from crawler {crawler_id}: {result['error']}")
+        else:
+            logging.error("Error message without crawler_id")
+        return None
+
+    # Process crawl result
+    url = result.get("url")
+    if not url:
+        logging.error("Missing URL in result")
+        return None
+
+    extracted_urls = result.get("extracted_urls", [])
+    if not isinstance(extracted_urls, list):
+        extracted_urls = []
+
+    content = result.get("content", "")
+    content_hash = result.get("content_hash")
+    crawler_id = result.get("crawler_id")
+    depth = result.get("depth", 0)
+    domain = urlparse(url).netloc
+
+    # Mark task as done
+    with state_lock:
+        task = tasks_in_progress.pop(result.get("task_id"), None)
+        if task is None:
+            logging.info(f"Result for {url} arrived after its lease expired")
+            if not claim_late_result(url):
+                logging.info(f"Dropping duplicate result for {url}; its requeued copy was already crawled")
+                RESULTS.inc(outcome='duplicate')
+                return None
+    if task is not None:
+        journal.record("done", result.get("task_id"))
+
+    logging.info(f"Received result from crawler {crawler_id} for {url} - {len(extracted_urls)} new URLs")
+
+    # Filter new URLs; the frontier and seen set lock themselves
+    new_urls = []
+    filtered = 0
+    for new_url in extracted_urls:
+        new_url = canonicalize_url(new_url)
+        if not (new_url and depth < MAX_CRAWL_DEPTH and is_allowed_domain(new_url) and
+                is_html_url(new_url)):
+            filtered += 1
+        elif seen_urls.add(new_url):
+            new_urls.append(new_url)
+        else:
+            # Already seen; if it is still queued this raises its link count
+            if crawl_queue.bump(new_url):
+                journal.record("bump", new_url)
+            filtered += 1
+
+    # Check the page against the fingerprints of pages already indexed
+    duplicate_of = None
+    if result.get("simhash"):
+        duplicate_of = near_duplicates.add(url, int(result["simhash"], 16))
+        if duplicate_of:
+            logging.info(f"{url} is a near-duplicate of {duplicate_of}")
+
+    with state_lock:
+        # Queue new URLs under state_lock, so their push records precede any lease journaled by assign_tasks
+        for new_url in new_urls:
+            crawl_queue.push(new_url, depth + 1)
+            journal.record("push", new_url, depth + 1)
+
+        stats["urls_crawled"] += 1
+        stats["total_links_found"] += len(extracted_urls)
+        stats["average_links_per_page"] = stats["total_links_found"] / stats["urls_crawled"]
+        stats["urls_in_queue"] += len(new_urls)
+        stats["filtered_urls"] += filtered
+        stats["domains_crawled"].add(domain)
+        stats["crawl_depth"][depth] = stats["crawl_depth"].get(depth, 0) + 1
+        stats["urls_in_progress"].discard(url)
+
+        if result.get("not_modified"):
+            # Unchanged since the last crawl; its links and content are already known
+            stats["not_modified"] += 1
+
+        if result.get("simhash"):
+            host_counts = host_duplicates.setdefault(domain, [0, 0])
+            host_counts[0] += 1
+            if duplicate_of:
+                host_counts[1] += 1
+                stats["near_duplicates"] += 1
+
+    RESULTS.inc(outcome='not_modified' if result.get("not_modified") else 'near_duplicate' if duplicate_of else 'crawled')
+
+    # Queue content for the indexer; stored content is passed by hash only
+    if duplicate_of and SKIP_NEAR_DUPLICATES:
+        return None
+    if content_hash:
+        return {"url": url, "content_hash": content_hash, "content_size": result.get("content_size")}
+    if content:
+        return {"url": url, "content": content}
+    return None
+
+def process_result_batch(messages):
+    """Handle a batch of result messages, then forward documents and acknowledge them in batches"""
+    index_batch = []
+    validators = {}  # url -> validators of each forwarded page, kept once it reaches the indexer queue
+    for message in messages:
+        try:
+            result = json.loads(message['Body'])
+            if not isinstance(result, dict):
+                logging.error(f"Invalid result format: {result}")
                 continue
+            trace = result.get("trace")
+            record_span(trace, 'master.result_queue_wait', stage_time(trace, "result_sent"))
+            with span(trace, 'master.process', url=result.get("url")):
+                document = handle_result(result)
+            if document:
+                if trace:
+                    mark_stage(trace, "forwarded")
+                    document["trace"] = trace
+                if result.get("etag") or result.get("last_modified"):
+                    validators[document["url"]] = {"etag": result.get("etag"), "last_modified": result.get("last_modified")}
+                index_batch.append(document)
+            else:
+                # The task ends here, so close its trace
+                record_span(trace, 'crawl', stage_time(trace, "leased"), root=True, url=result.get("url"), indexed=False)
+        except Exception as e:
+            logging.error(f"Error processing result: {str(e)}")
+
+    # Send content to the indexer shard that owns each URL
+    shard_batches = {}
+    for document in index_batch:
+        shard = shard_for_url(document["url"], len(INDEXER_URLS))
+        shard_batches.setdefault(shard, []).append(document)
+    for shard, documents in shard_batches.items():
+        message_ids = send_messages_batch(shard_queue_name(shard, len(INDEXER_URLS)), documents)
+        with state_lock:
+            for document, message_id in zip(documents, message_ids):
+                if not message_id:
+                    continue
+                stats["urls_indexed"] += 1
+                # Remember validators so the next crawl of this page can be conditional
+                if document["url"] in validators:
+                    page_validators[document["url"]] = validators[document["url"]]
+                else:
+                    page_validators.pop(document["url"], None)
+
+    # Delete processed messages, including ones that could not be processed
+    delete_messages_batch(RESULT_QUEUE_NAME, [message['ReceiptHandle'] for message in messages])
+
+def receive_results():
+    """Long-poll the result queue and hand batches to the result workers"""
+    while True:
+        try:
+            messages = receive_messages(RESULT_QUEUE_NAME)
+            if messages:
+                result_batches.put(messages)
+        except Exception as e:
+            logging.error(f"Error receiving results: {e}")
+            time.sleep(1)
 
-        time.sleep(0.5)
+def process_results():
+    """Result worker: processes batches from the receivers"""
+    while True:
+        messages = result_batches.get()
+        try:
+            with RESULT_BATCH_SECONDS.time():
+                process_result_batch(messages)
+        except Exception as e:
+            logging.error(f"Error processing result batch: {e}")
 
 def assign_tasks():
-    """Assign URLs to crawlers"""
+    """Keep the crawler queue stocked with leased tasks for whichever crawler is free"""
     while True:
-        # Update active crawlers count
-        stats["active_crawlers"] = len(tasks_in_progress)
-        
-        # Reassign unresponsive crawlers
         current_time = time.time()
-        for crawler_id, task in list(tasks_in_progress.items()):
-            # Unresponsive crawlers check
-            last_active = task.get('last_heartbeat', task['start_time'])
-            if current_time - last_active > CRAWL_TIMEOUT:
-                logging.warning(f"Crawler {crawler_id} unresponsive. Last active: {last_active}. Reassigning URL: {task['url']}")
-                stats["active_crawlers"] -= 1
-
-            # Handle timeouts and failures
-            if current_time - task['start_time'] > CRAWL_TIMEOUT:
-                logging.warning(f"Crawler {crawler_id} timed out. Reassigning URL: {task['url']}")
-                crawl_queue.appendleft(task['url'])
-                tasks_in_progress.pop(crawler_id)
-                stats["urls_in_progress"].discard(task['url'])
-                stats["active_crawlers"] -= 1
-
-        # Assign new URLs to idle crawlers
-        for crawler_id in range(1, NUM_CRAWLERS + 1):
-            if crawler_id not in tasks_in_progress and crawl_queue:
-                url = crawl_queue.popleft()
-                if url not in stats["urls_in_progress"]:
-                    send_message(CRAWLER_QUEUE_NAME, {"url": url, "depth": 0, "crawler_id": crawler_id})
-                    tasks_in_progress[crawler_id] = {
-                        "url": url,
-                        "start_time": time.time()
-                    }
-                    stats["urls_in_progress"].add(url)
-                    logging.info(f"Assigned URL {url} to crawler {crawler_id}")
-                    stats["urls_in_queue"] -= 1
+        assignments = []
+
+        with state_lock:
+            # Drop crawlers that stopped sending heartbeats
+            for crawler_id, node in list(crawlers.items()):
+                if current_time - node["last_seen"] > CRAWL_TIMEOUT:
+                    logging.warning(f"Crawler {crawler_id} unresponsive. Last active: {node['last_seen']}. Removing it")
+                    del crawlers[crawler_id]
+            stats["active_crawlers"] = len(crawlers)
+
+            # Reassign tasks whose lease expired or whose crawler is gone
+            for task_id, task in list(tasks_in_progress.items()):
+                crawler_id = task.get("crawler_id")
+                if crawler_id is not None and crawler_id not in crawlers and task['start_time']:
+                    logging.warning(f"Crawler {crawler_id} is gone. Reassigning URL: {task['url']}")
+                    task['start_time'] = 0  # expire the lease now
+
+                if current_time - task['start_time'] > TASK_LEASE_TIMEOUT:
+                    logging.warning(f"Task {task_id} lease expired. Reassigning URL: {task['url']}")
+                    crawl_queue.push_front(task['url'], task['depth'])
+                    tasks_in_progress.pop(task_id)
+                    journal.record("requeue", task_id)
+                    stats["urls_in_progress"].discard(task['url'])
+                    stats["urls_in_queue"] += 1
+
+            # Lease enough tasks to keep every live crawler's fetch slots busy; any idle crawler takes the next one.
+            # No host gets more leases than can be fetched politely before they expire: the frontier passes
+            # over hosts at MAX_LEASES_PER_HOST until a later pass finds some of their leases finished.
+            lease_target = sum(node["capacity"] for node in crawlers.values()) * TASKS_PER_SLOT
+            host_leases = {}
+            for task in tasks_in_progress.values():
+                host = url_host(task["url"])
+                host_leases[host] = host_leases.get(host, 0) + 1
+            crawl_queue.set_paused_hosts(host for host, leases in host_leases.items() if leases >= MAX_LEASES_PER_HOST)
+
+            while len(tasks_in_progress) < lease_target:
+                next_url = crawl_queue.pop()
+                if next_url is None:
+                    break
+                url, depth = next_url
+                stats["urls_in_queue"] -= 1
+                if url in stats["urls_in_progress"]:
+                    continue
+                task_id = uuid.uuid4().hex
+                task = {"task_id": task_id, "url": url, "depth": depth, "trace": new_trace()}
+                if url in page_validators:
+                    task["validators"] = page_validators[url]
+                assignments.append(task)
+                tasks_in_progress[task_id] = {
+                    "url": url,
+                    "depth": depth,
+                    "crawler_id": None,
+                    "start_time": time.time()
+                }
+                stats["urls_in_progress"].add(url)
+                host = url_host(url)
+                host_leases[host] = host_leases.get(host, 0) + 1
+                if host_leases[host] >= MAX_LEASES_PER_HOST:
+                    crawl_queue.pause_host(host)
+                journal.record("lease", task_id, url, depth)
+                logging.info(f"Leased URL {url} as task {task_id}")
+
+        send_messages_batch(CRAWLER_QUEUE_NAME, assignments)
 
         time.sleep(0.5)
 
+def persist_seen_urls():
+    """Periodically save the seen set so a restarted master does not refetch pages"""
+    while True:
+        time.sleep(SEEN_SET_SAVE_INTERVAL)
+        try:
+            save_seen_set(seen_urls, SEEN_SET_PATH)
+            logging.info(f"Saved {len(seen_urls)} seen URLs to {SEEN_SET_PATH}")
+        except Exception as e:
+            logging.error(f"Failed to save seen URLs: {e}")
+
+def snapshot_state():
+    """Copy the state needed to resume a crawl"""
+    with state_lock:
+        state = {
+            "tasks": [(task_id, task["url"], task["depth"]) for task_id, task in tasks_in_progress.items()],
+            "stats": {k: set(v) if isinstance(v, set) else dict(v) if isinstance(v, dict) else v
+                      for k, v in stats.items()},
+            "page_validators": dict(page_validators),
+            "host_duplicates": {host: list(counts) for host, counts in host_duplicates.items()},
+        }
+    state["frontier"] = crawl_queue.snapshot()
+    state["seen_urls"] = seen_urls
+    state["near_duplicates"] = near_duplicates
+    return state
+
+def restore_state():
+    """Load the last snapshot and replay the journal written after it"""
+    global seen_urls, near_duplicates, journal
+    start = time.time()
+    state, records, next_generation = load_checkpoint(CHECKPOINT_DIR)
+    tasks = {}  # task_id -> (url, depth)
+    if state:
+        seen_urls = state["seen_urls"]
+        near_duplicates = state["near_duplicates"]
+        stats.update(state["stats"])
+        page_validators.update(state["page_validators"])
+        host_duplicates.update(state["host_duplicates"])
+        crawl_queue.load(state["frontier"])
+        tasks = {task_id: (url, depth) for task_id, url, depth in state["tasks"]}
+
+    # Replaying is idempotent, so records already reflected in the snapshot are harmless
+    replayed = 0
+    for record in records:
+        op = record[0]
+        if op == "push":
+            seen_urls.add(record[1])
+            crawl_queue.push(record[1], record[2])
+        elif op == "bump":
+            crawl_queue.bump(record[1])
+        elif op == "discard":
+            crawl_queue.discard(record[1])
+        elif op == "lease":
+            crawl_queue.discard(record[2])
+            tasks[record[1]] = (record[2], record[3])
+        elif op == "done":
+            tasks.pop(record[1], None)
+        elif op == "requeue":
+            task = tasks.pop(record[1], None)
+            if task:
+                crawl_queue.push_front(*task)
+        replayed += 1
+
+    # Leases keep their task ids, so results for tasks already sent to crawlers still match;
+    # the lease clock restarts and unfinished tasks are reassigned as usual
+    stats["urls_in_progress"] = set()
+    for task_id, (url, depth) in tasks.items():
+        tasks_in_progress[task_id] = {"url": url, "depth": depth, "crawler_id": None, "start_time": time.time()}
+        stats["urls_in_progress"].add(url)
+    stats["urls_in_queue"] = len(crawl_queue)
+
+    journal = Journal(CHECKPOINT_DIR, next_generation)
+    logging.info(f"Restored {len(crawl_queue)} queued URLs, {len(tasks_in_progress)} leases and "
+                 f"{len(seen_urls)} seen URLs ({replayed} journal records) in {time.time() - start:.1f}s")
+
+def checkpoint_state():
+    """Flush the journal continuously and take a snapshot every CHECKPOINT_INTERVAL"""
+    last_snapshot = time.time()
+    while True:
+        time.sleep(JOURNAL_FLUSH_INTERVAL)
+        journal.flush()
+        if time.time() - last_snapshot < CHECKPOINT_INTERVAL:
+            continue
+        last_snapshot = time.time()
+        try:
+            # Rotate first: changes made while copying land in the new segment and replay idempotently
+            generation = journal.rotate()
+            save_snapshot(CHECKPOINT_DIR, generation, snapshot_state())
+            logging.info(f"Saved checkpoint {generation} in {time.time() - last_snapshot:.1f}s")
+        except Exception as e:
+            logging.error(f"Failed to save checkpoint: {e}")
+
 @app.route('/add_urls', methods=['POST'])
 def add_urls():
     data = request.get_json()
@@ -245,15 +637,99 @@ def add_urls():
         return jsonify({"error": "No URLs provided"}), 400
     
     urls = data['urls']
+    recrawl = data.get('recrawl', False)  # queue URLs again even if already crawled
     added_count = 0
-    for url in urls:
-        if is_allowed_domain(url) and is_html_url(url) and url not in crawl_queue:
-            crawl_queue.append(url)
-            stats["urls_in_queue"] += 1
-            added_count += 1
+    with state_lock:
+        # Pushed and journaled under state_lock, like results, so no lease is journaled in between
+        for url in urls:
+            url = canonicalize_url(url)
+            if (url and is_allowed_domain(url) and is_html_url(url) and (seen_urls.add(url) or recrawl)
+                    and crawl_queue.push(url, 0)):  # a recrawl of a URL that is still queued adds nothing
+                journal.record("push", url, 0)
+                added_count += 1
+        stats["urls_in_queue"] += added_count
     
     return jsonify({"message": f"Added {added_count} URLs", "filtered": len(urls) - added_count}), 200
 
+def process_search_replies():
+    """Hand search results arriving on the reply queue to the request waiting for them"""
+    while True:
+        messages = receive_messages(SEARCH_REPLY_QUEUE_NAME)
+        for message in messages:
+            try:
+                reply = json.loads(message['Body'])
+                pending = pending_searches.get(reply.get("correlation_id"))
+                if pending:
+                    if reply.get("type") == "term_stats_result":
+                        pending["results"].append(reply.get("stats"))
+                    else:
+                        pending["results"].append(reply.get("results", []))
+                    pending["remaining"] -= 1
+                    if pending["remaining"] <= 0:
+                        pending["event"].set()
+                else:
+                    logging.warning(f"Discarding search reply with unknown correlation id {reply.get('correlation_id')}")
+            except Exception as e:
+                logging.error(f"Error processing search reply: {e}")
+        delete_messages_batch(SEARCH_REPLY_QUEUE_NAME, [message['ReceiptHandle'] for message in messages])
+
+def ask_shards(message):
+    """Send a message through every shard's indexer queue and return the correlated replies, or None on timeout"""
+    correlation_id = uuid.uuid4().hex
+    num_shards = len(INDEXER_URLS)
+    pending = {"event": threading.Event(), "results": [], "remaining": num_shards}
+    pending_searches[correlation_id] = pending
+    try:
+        for shard in range(num_shards):
+            send_message(shard_queue_name(shard, num_shards), dict(message, **{
+                "correlation_id": correlation_id,
+                "reply_queue": SEARCH_REPLY_QUEUE_NAME,
+                "timestamp": time.time()
+            }))
+        if pending["event"].wait(QUEUE_SEARCH_TIMEOUT):
+            return pending["results"]
+        return None
+    finally:
+        pending_searches.pop(correlation_id, None)
+
+def search_via_queue(query):
+    """Search every shard through its indexer queue, with the same global term statistics as search_shards"""
+    stats = None
+    if len(INDEXER_URLS) > 1:
+        shard_stats = ask_shards({"type": "term_stats", "query": query})
+        if shard_stats is None:
+            return None
+        stats = merge_term_stats(shard_stats)
+    shard_results = ask_shards({"type": "search", "query": query, "limit": SEARCH_LIMIT, "stats": stats})
+    if shard_results is None:
+        return None
+    return merge_results(shard_results, SEARCH_LIMIT)
+
+def search_shards(query):
+    """Scatter the search to every shard and gather one merged top-k list.
+
+    With several shards, collection-wide term statistics are gathered first
+    and sent with the search, so every shard scores documents as a single
+    combined index would and the scores can be compared directly.
+    """
+    def get(url, **params):
+        response = requests.get(url, params=params, timeout=SEARCH_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def post(url, body):
+        response = requests.post(url, json=body, timeout=SEARCH_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    if len(INDEXER_URLS) == 1:
+        return get(f"{INDEXER_URLS[0]}/search", q=query, limit=SEARCH_LIMIT)
+
+    shard_stats = search_pool.map(lambda base: get(f"{base}/term_stats", q=query), INDEXER_URLS)
+    body = {"q": query, "limit": SEARCH_LIMIT, "stats": merge_term_stats(shard_stats)}
+    shard_results = search_pool.map(lambda base: post(f"{base}/search", body), INDEXER_URLS)
+    return merge_results(shard_results, SEARCH_LIMIT)
+
 @app.route('/search', methods=['GET'])
 def search():
     query = request.args.get('q')
@@ -264,99 +740,98 @@ def search():
         return jsonify({"error": "No query provided"}), 400
     
     try:
-        # Clear any old search results first
-        messages = receive_messages(RESULT_QUEUE_NAME, max_messages=10)
-        for msg in messages:
-            try:
-                result = json.loads(msg['Body'])
-                if result.get("type") == "search_result":
-                    delete_message(RESULT_QUEUE_NAME, msg['ReceiptHandle'])
-            except:
-                delete_message(RESULT_QUEUE_NAME, msg['ReceiptHandle'])
-        
-        # Forward search request to indexer
-        logging.info(f"Forwarding search request to indexer for query: {query}")
-        send_message(INDEXER_QUEUE_NAME, {
-            "type": "search",
-            "query": query,
-            "timestamp": time.time()
-        })
-        
-        # Wait for result with timeout
-        start_time = time.time()
-        timeout = 30
-        attempts = 0
-        max_attempts = 20
-        
-        while time.time() - start_time < timeout:
-            attempts += 1
-            logging.info(f"Checking for search results (attempt {attempts}/{max_attempts})")
-            
-            messages = receive_messages(RESULT_QUEUE_NAME, max_messages=10, wait_time=1)
-            if messages:
-                logging.info(f"Received {len(messages)} messages from result queue")
-            
-            for message in messages:
-                try:
-                    result = json.loads(message['Body'])
-                    logging.info(f"Processing message: {json.dumps(result)}")
-                    
-                    if result.get("type") == "search_result":
-                        results = result.get("results", [])
-                        logging.info(f"Found search results: {len(results)} matches")
-                        delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                        return jsonify(results), 200
-                except json.JSONDecodeError:
-                    logging.error("Failed to decode search result message")
-                    delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                    continue
-                except Exception as e:
-                    logging.error(f"Error processing message: {e}", exc_info=True)
-                    delete_message(RESULT_QUEUE_NAME, message['ReceiptHandle'])
-                    continue
-            
-            if attempts >= max_attempts:
-                logging.warning("Maximum attempts reached while waiting for search results")
-                break
-                
-            time.sleep(0.5)  # Shorter sleep between checks
-        
-        logging.warning("Search request timed out")
-        return jsonify({"error": "Search timed out"}), 504  # Gateway Timeout
+        try:
+            with SEARCH_SECONDS.time(path='api'):
+                results = search_shards(query)
+        except requests.RequestException as e:
+            logging.warning(f"Indexer search API unavailable ({e}), searching over the queue")
+            with SEARCH_SECONDS.time(path='queue'):
+                results = search_via_queue(query)
+            if results is None:
+                logging.warning("Search request timed out")
+                return jsonify({"error": "Search timed out"}), 504  # Gateway Timeout
+
+        logging.info(f"Found search results: {len(results)} matches")
+        return jsonify(results), 200
         
     except Exception as e:
         logging.error(f"Search error: {e}", exc_info=True)
         return jsonify({"error": "Search failed"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+@app.route('/autoscale', methods=['GET'])
+def get_autoscale():
+    return jsonify(autoscale_signal()), 200
+
 @app.route('/status', methods=['GET'])
 def get_status():
     logging.info("Received status request")
-    status = dict(stats)
-    # Convert all sets to lists for JSON serialization
-    for k, v in status.items():
-        if isinstance(v, set):
-            status[k] = list(v)
+    with state_lock:
+        # Convert all sets to lists for JSON serialization
+        status = {k: list(v) if isinstance(v, set) else dict(v) if isinstance(v, dict) else v
+                  for k, v in stats.items()}
+    status["urls_seen"] = len(seen_urls)
+    autoscale = autoscale_signal()
+    status["crawler_capacity"] = autoscale["crawler_capacity"]
+    status["desired_crawlers"] = autoscale["desired_crawlers"]
     logging.info(f"Returning status: {json.dumps(status, default=str)}")
     return jsonify(status), 200
 
 
 if __name__ == '__main__':
-    # Add initial seed URLs
+    set_service("master")
+
+    # Resume from the last checkpoint, if any
+    if CHECKPOINT_DIR:
+        restore_state()
+
+    # Add initial seed URLs (already seen after a restore)
     seed_urls = [
         "https://www.python.org"
     ]
     
     # Add seed URLs to crawl queue
-    for url in seed_urls:
-        if is_allowed_domain(url) and is_html_url(url):
-            crawl_queue.append(url)
+    for url in map(canonicalize_url, seed_urls):
+        if is_allowed_domain(url) and is_html_url(url) and seen_urls.add(url):
+            crawl_queue.push(url, 0)
+            journal.record("push", url, 0)
             stats["urls_in_queue"] += 1
             logging.info(f"Added seed URL to queue: {url}")
 
-    # Start result processing thread
-    result_thread = threading.Thread(target=process_results)
-    result_thread.daemon = True
-    result_thread.start()
+    # Start result receiver and worker threads
+    for _ in range(RESULT_RECEIVERS):
+        receiver_thread = threading.Thread(target=receive_results)
+        receiver_thread.daemon = True
+        receiver_thread.start()
+    for _ in range(RESULT_WORKERS):
+        result_thread = threading.Thread(target=process_results)
+        result_thread.daemon = True
+        result_thread.start()
+
+    # Start seen set persistence thread
+    if SEEN_SET_PATH:
+        seen_thread = threading.Thread(target=persist_seen_urls)
+        seen_thread.daemon = True
+        seen_thread.start()
+
+    # Start control (heartbeat) thread
+    control_thread = threading.Thread(target=process_control)
+    control_thread.daemon = True
+    control_thread.start()
+
+    # Start checkpoint thread
+    if CHECKPOINT_DIR:
+        checkpoint_thread = threading.Thread(target=checkpoint_state)
+        checkpoint_thread.daemon = True
+        checkpoint_thread.start()
+
+    # Start search reply thread
+    search_reply_thread = threading.Thread(target=process_search_replies)
+    search_reply_thread.daemon = True
+    search_reply_thread.start()
 
     # Start task assignment thread
     task_thread = threading.Thread(target=assign_tasks)
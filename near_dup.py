@@ -0,0 +1,103 @@
+import re
+import hashlib
+import threading
+from collections import Counter
+
+# SimHash configuration
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3  # words per shingle
+SIMHASH_MAX_DISTANCE = 3  # fingerprints differing in at most this many bits are near-duplicates
+SIMHASH_BANDS = 4  # LSH bands; must exceed SIMHASH_MAX_DISTANCE so every match shares a band
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+def simhash(text):
+    """64-bit SimHash of the text's word shingles; similar texts get fingerprints a few bits apart"""
+    features = Counter(_shingles(text))
+    if not features:
+        return 0
+
+    # Sum weights per byte value first, so the per-bit pass is over 256 buckets, not every shingle
+    byte_weights = [[0] * 256 for _ in range(SIMHASH_BITS // 8)]
+    total = 0
+    for feature, weight in features.items():
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=SIMHASH_BITS // 8).digest()
+        for i, value in enumerate(digest):
+            byte_weights[i][value] += weight
+        total += weight
+
+    fingerprint = 0
+    for i, weights in enumerate(byte_weights):
+        for bit in range(8):
+            ones = sum(weight for value, weight in enumerate(weights) if value >> bit & 1)
+            if 2 * ones > total:
+                fingerprint |= 1 << (i * 8 + bit)
+    return fingerprint
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class SimHashIndex:
+    """LSH index of page fingerprints for finding near-duplicate pages.
+
+    Fingerprints are split into bands and bucketed by each band's value.
+    Two fingerprints within `max_distance` bits must agree on at least one
+    band, so only pages sharing a bucket are compared.
+    """
+
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE, bands=SIMHASH_BANDS):
+        if bands <= max_distance:
+            raise ValueError("bands must be greater than max_distance")
+        self.max_distance = max_distance
+        self.band_bits = SIMHASH_BITS // bands
+        self._buckets = [{} for _ in range(bands)]  # band value -> [(fingerprint, url)]
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _band_values(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (i * self.band_bits)) & mask for i in range(len(self._buckets))]
+
+    def _find(self, fingerprint, exclude_url=None):
+        for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+            for other, url in buckets.get(value, ()):
+                if url != exclude_url and hamming_distance(fingerprint, other) <= self.max_distance:
+                    return url
+        return None
+
+    def find(self, fingerprint):
+        """Return the URL of an indexed near-duplicate, or None"""
+        with self._lock:
+            return self._find(fingerprint)
+
+    def add(self, url, fingerprint):
+        """Record a page, returning the URL of an earlier near-duplicate instead if there is one"""
+        with self._lock:
+            duplicate = self._find(fingerprint, exclude_url=url)
+            if duplicate is not None:
+                return duplicate
+            for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+                buckets.setdefault(value, []).append((fingerprint, url))
+            self._count += 1
+            return None
+
+    def __len__(self):
+        return self._count
+
+    def __getstate__(self):
+        with self._lock:
+            state = dict(self.__dict__)
+            del state['_lock']
+            state['_buckets'] = [{value: list(entries) for value, entries in buckets.items()}
+                                 for buckets in self._buckets]
+            return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+import urllib.robotparser
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# robots.txt cache configuration
+ROBOTS_TTL = 24 * 3600  # seconds a fetched robots.txt is trusted
+ROBOTS_FAILURE_TTL = 600  # seconds an unreachable robots.txt (or 5xx) is cached before retrying
+ROBOTS_CACHE_SIZE = 10000  # hosts kept in memory; least recently used are dropped
+ROBOTS_TIMEOUT = 10  # seconds allowed for fetching robots.txt
+ROBOTS_MAX_BYTES = 500 * 1024  # robots.txt is truncated to this size, as RFC 9309 allows
+ROBOTS_SHARED_DIR = os.environ.get('ROBOTS_CACHE_DIR')  # directory shared by all crawlers, or None
+
+class RobotsRules:
+    """Parsed robots.txt for one origin and when it stops being trusted"""
+
+    def __init__(self, status, text, fetched_at):
+        self.status = status  # HTTP status, or 0 if the fetch failed
+        self.text = text
+        self.fetched_at = fetched_at
+        self.parser = urllib.robotparser.RobotFileParser()
+        # Per RFC 9309: a missing robots.txt (4xx) allows everything, an
+        # unreachable one (5xx or network error) disallows everything for now
+        if 200 <= status < 300:
+            self.parser.parse(text.splitlines())
+            self.expires = fetched_at + ROBOTS_TTL
+        elif 400 <= status < 500:
+            self.parser.allow_all = True
+            self.expires = fetched_at + ROBOTS_TTL
+        else:
+            self.parser.disallow_all = True
+            self.expires = fetched_at + ROBOTS_FAILURE_TTL
+        self.parser.modified()
+
+    def to_dict(self):
+        return {"status": self.status, "text": self.text, "fetched_at": self.fetched_at}
+
+class RobotsCache:
+    """Bounded, expiring cache of robots.txt rules, fetched through an HttpClient.
+
+    Failures are cached too, with a shorter TTL, so a dead host is not
+    retried for every URL. Concurrent lookups for the same origin wait for a
+    single fetch. With `shared_dir`, fetched rules are also written to a
+    directory all crawler nodes can read, so each host's robots.txt is
+    fetched once per fleet.
+    """
+
+    def __init__(self, http_client, user_agent, max_size=ROBOTS_CACHE_SIZE, shared_dir=ROBOTS_SHARED_DIR):
+        self.http_client = http_client
+        self.user_agent = user_agent
+        self.max_size = max_size
+        self.shared_dir = shared_dir
+        self._entries = OrderedDict()  # origin -> RobotsRules
+        self._fetching = {}  # origin -> Event set when its fetch finishes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def origin(url):
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc.lower()}"
+
+    def _cached(self, origin):
+        """Return unexpired rules from memory, or None. Caller holds the lock."""
+        entry = self._entries.get(origin)
+        if entry is None:
+            return None
+        if entry.expires <= time.time():
+            del self._entries[origin]
+            return None
+        self._entries.move_to_end(origin)
+        return entry
+
+    def _put(self, origin, entry):
+        with self._lock:
+            self._entries[origin] = entry
+            self._entries.move_to_end(origin)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _fetch(self, origin):
+        robots_url = origin + "/robots.txt"
+        try:
+            with self.http_client.get(robots_url, timeout=ROBOTS_TIMEOUT, stream=True) as response:
+                body = b''
+                if 200 <= response.status_code < 300:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        body += chunk
+                        if len(body) >= ROBOTS_MAX_BYTES:
+                            body = body[:ROBOTS_MAX_BYTES]
+                            break
+                logging.info(f"Fetched robots.txt for {origin}: {response.status_code}")
+                return RobotsRules(response.status_code, body.decode('utf-8', errors='replace'), time.time())
+        except Exception as e:
+            logging.warning(f"Failed to fetch robots.txt for {origin}, disallowing for {ROBOTS_FAILURE_TTL}s: {e}")
+            return RobotsRules(0, '', time.time())
+
+    def _shared_path(self, origin):
+        name = hashlib.sha1(origin.encode('utf-8')).hexdigest()
+        return os.path.join(self.shared_dir, name[:2], name + '.json')
+
+    def _load_shared(self, origin):
+        try:
+            with open(self._shared_path(origin)) as f:
+                entry = RobotsRules(**json.load(f))
+            return entry if entry.expires > time.time() else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable shared robots.txt entry for {origin}: {e}")
+            return None
+
+    def _save_shared(self, origin, entry):
+        path = self._shared_path(origin)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to share robots.txt entry for {origin}: {e}")
+
+    def get(self, url):
+        """Return the robots.txt rules for the URL's origin, fetching them if needed"""
+        origin = self.origin(url)
+        while True:
+            with self._lock:
+                entry = self._cached(origin)
+                if entry is not None:
+                    return entry
+                event = self._fetching.get(origin)
+                if event is None:
+                    event = self._fetching[origin] = threading.Event()
+                    break
+            # Another thread is fetching this origin's robots.txt
+            event.wait(ROBOTS_TIMEOUT * 2)
+
+        try:
+            entry = self._load_shared(origin) if self.shared_dir else None
+            if entry is None:
+                entry = self._fetch(origin)
+                if self.shared_dir:
+                    self._save_shared(origin, entry)
+            self._put(origin, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._fetching.pop(origin).set()
+
+    def allowed(self, url):
+        return self.get(url).parser.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url):
+        """Crawl-delay for the URL's host if its robots.txt is already cached, else None.
+
+        Never fetches, so it is safe to call from the event loop.
+        """
+        with self._lock:
+            entry = self._cached(self.origin(url))
+        if entry is None:
+            return None
+        return entry.parser.crawl_delay(self.user_agent)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,177 @@
+import json
+import time
+import logging
+import threading
+from math import log
+from collections import OrderedDict
+from whoosh.qparser import QueryParser
+from whoosh.scoring import BM25F, BM25FScorer, WeightScorer
+from whoosh.searching import Searcher
+
+# Configuration
+QUERY_CACHE_SIZE = 4096  # parsed queries kept
+RESULT_CACHE_SIZE = 4096  # result lists kept for the current index generation
+REFRESH_CHECK_INTERVAL = 1  # seconds between checks for commits made by other writers
+
+class LRUCache:
+    """Small thread-safe LRU mapping"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+def normalize_query(query_str):
+    return ' '.join(query_str.split())
+
+class GlobalStatsBM25F(BM25F):
+    """BM25F scored with collection-wide statistics instead of this shard's.
+
+    `stats` is the output of sharding.merge_term_stats(), so every shard
+    scores a document exactly as a single combined index would.
+    """
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.doc_count = stats["doc_count"]
+        self.field_length = stats["field_length"]
+        self.doc_frequency = {(fieldname, text): df for fieldname, text, df in stats["terms"]}
+
+    def scorer(self, searcher, fieldname, text, qf=1):
+        if not searcher.schema[fieldname].scorable:
+            return WeightScorer.for_(searcher, fieldname, text)
+        B = self._field_B.get(fieldname, self.B)
+        return GlobalStatsBM25FScorer(self, searcher, fieldname, text, B, self.K1, qf=qf)
+
+class GlobalStatsBM25FScorer(BM25FScorer):
+    def __init__(self, model, searcher, fieldname, text, B, K1, qf=1):
+        term = text.decode('utf-8') if isinstance(text, bytes) else text
+        df = model.doc_frequency.get((fieldname, term))
+        if df is None or not model.doc_count:
+            # Term missing from the global statistics; fall back to this shard's
+            parent = searcher.get_parent()
+            self.idf = parent.idf(fieldname, text)
+            self.avgfl = parent.avg_field_length(fieldname) or 1
+        else:
+            # Same formula as WeightingModel.idf(), over the whole collection
+            self.idf = log(model.doc_count / (df + 1)) + 1
+            self.avgfl = (model.field_length.get(fieldname, 0) / model.doc_count) or 1
+
+        self.B = B
+        self.K1 = K1
+        self.qf = qf
+        self.setup(searcher, fieldname, text)
+
+class SearchService:
+    """Keeps one searcher open and caches parsed queries and results.
+
+    The searcher is only reopened when the index generation changes, either
+    because mark_stale() was called after a commit or because a periodic
+    check found a newer generation on disk. Cached results are dropped
+    whenever the generation changes; parsed queries depend only on the
+    schema and are kept.
+    """
+
+    def __init__(self, ix, limit=10):
+        self.ix = ix
+        self.limit = limit
+        self.parser = QueryParser("content", ix.schema)
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self._searcher = ix.searcher()
+        self._stale = False
+        self._last_check = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._searcher.reader().generation()
+
+    def mark_stale(self):
+        """Called after a commit so the next search picks up the new generation"""
+        self._stale = True
+
+    def _refresh_if_changed(self):
+        now = time.time()
+        if not self._stale and now - self._last_check < REFRESH_CHECK_INTERVAL:
+            return
+        self._stale = False
+        self._last_check = now
+        if self._searcher.up_to_date():
+            return
+        old_generation = self.generation
+        self._searcher = self._searcher.refresh()
+        self.result_cache.clear()
+        logging.debug(f"Search index refreshed from generation {old_generation} to {self.generation}")
+
+    def parse(self, query_str):
+        key = normalize_query(query_str)
+        query = self.query_cache.get(key)
+        if query is None:
+            query = self.parser.parse(key)
+            self.query_cache.put(key, query)
+        return query
+
+    def term_stats(self, query_str):
+        """Statistics a coordinator needs to score this query consistently across shards"""
+        with self._lock:
+            self._refresh_if_changed()
+            searcher = self._searcher
+            terms = [[fieldname, text.decode('utf-8') if isinstance(text, bytes) else text,
+                      searcher.doc_frequency(fieldname, text)]
+                     for fieldname, text in self.parse(query_str).all_terms()]
+            return {
+                "doc_count": searcher.doc_count_all(),
+                "field_length": {"content": searcher.field_length("content")},
+                "terms": terms,
+            }
+
+    def search(self, query_str, limit=None, global_stats=None):
+        """Return the top (url, score) pairs for the query.
+
+        With `global_stats`, documents are scored using collection-wide
+        statistics so results from different shards can be merged.
+        """
+        limit = limit or self.limit
+        try:
+            with self._lock:
+                self._refresh_if_changed()
+                stats_key = json.dumps(global_stats, sort_keys=True) if global_stats else None
+                key = (normalize_query(query_str), limit, stats_key)
+                results = self.result_cache.get(key)
+                if results is None:
+                    if global_stats:
+                        # Share the open reader; only the weighting differs
+                        searcher = Searcher(self._searcher.reader(), weighting=GlobalStatsBM25F(global_stats),
+                                            closereader=False)
+                        hits = searcher.search(self.parse(query_str), limit=limit)
+                        results = [(hit['url'], hit.score) for hit in hits]
+                    else:
+                        hits = self._searcher.search(self.parse(query_str), limit=limit)
+                        results = [(hit['url'], hit.score) for hit in hits]
+                    self.result_cache.put(key, results)
+                return results
+        except Exception as e:
+            logging.error(f"Error searching: {e}")
+            return []
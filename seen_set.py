@@ -0,0 +1,152 @@
+import os
+import math
+import pickle
+import hashlib
+import logging
+import threading
+
+# Bloom filter defaults
+BLOOM_INITIAL_CAPACITY = 1000000  # URLs held by the first filter layer
+BLOOM_ERROR_RATE = 0.001  # target false positive rate across all layers
+BLOOM_GROWTH = 2  # each new layer holds this many times more URLs than the last
+BLOOM_TIGHTENING = 0.5  # each new layer gets this fraction of the previous error rate
+
+def _hash_pair(url):
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+class HashSeenSet:
+    """Exact seen-URL set backed by a Python set"""
+
+    def __init__(self):
+        self._urls = set()
+        self._lock = threading.Lock()
+
+    def add(self, url):
+        """Add a URL, returning True if it had not been seen before"""
+        with self._lock:
+            if url in self._urls:
+                return False
+            self._urls.add(url)
+            return True
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __getstate__(self):
+        with self._lock:
+            return {'urls': set(self._urls)}
+
+    def __setstate__(self, state):
+        self._urls = state['urls']
+        self._lock = threading.Lock()
+
+class _BloomLayer:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, h1, h2):
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def contains(self, h1, h2):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2))
+
+    def add(self, h1, h2):
+        for p in self._positions(h1, h2):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+class BloomSeenSet:
+    """Scalable Bloom filter for very large crawls.
+
+    Uses a fixed amount of memory per URL regardless of URL length, at the
+    cost of a small false positive rate (a few new URLs are treated as seen).
+    A new, larger layer is added whenever the current one is full.
+    """
+
+    def __init__(self, initial_capacity=BLOOM_INITIAL_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self._layers = []
+        self._lock = threading.Lock()
+        self._add_layer()
+
+    def _add_layer(self):
+        n = len(self._layers)
+        capacity = self.initial_capacity * BLOOM_GROWTH ** n
+        # Tightening each layer's error rate keeps the overall rate under error_rate
+        error_rate = self.error_rate * (1 - BLOOM_TIGHTENING) * BLOOM_TIGHTENING ** n
+        self._layers.append(_BloomLayer(capacity, error_rate))
+
+    def _contains(self, h1, h2):
+        return any(layer.contains(h1, h2) for layer in self._layers)
+
+    def add(self, url):
+        """Add a URL, returning True if it had not been seen before"""
+        h1, h2 = _hash_pair(url)
+        with self._lock:
+            if self._contains(h1, h2):
+                return False
+            if self._layers[-1].count >= self._layers[-1].capacity:
+                self._add_layer()
+            self._layers[-1].add(h1, h2)
+            return True
+
+    def __contains__(self, url):
+        return self._contains(*_hash_pair(url))
+
+    def __len__(self):
+        return sum(layer.count for layer in self._layers)
+
+    def __getstate__(self):
+        with self._lock:
+            state = dict(self.__dict__)
+            del state['_lock']
+            state['_layers'] = [_copy_layer(layer) for layer in self._layers]
+            return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def _copy_layer(layer):
+    copy = _BloomLayer.__new__(_BloomLayer)
+    copy.__dict__.update(layer.__dict__)
+    copy.bits = bytearray(layer.bits)
+    return copy
+
+SEEN_SET_TYPES = {
+    'hash': HashSeenSet,
+    'bloom': BloomSeenSet,
+}
+
+def create_seen_set(kind='hash', path=None):
+    """Create a seen-URL set, loading it from `path` if a saved copy exists"""
+    if path and os.path.exists(path):
+        try:
+            seen = load_seen_set(path)
+            logging.info(f"Loaded {len(seen)} seen URLs from {path}")
+            return seen
+        except Exception as e:
+            logging.error(f"Failed to load seen URLs from {path}, starting empty: {e}")
+    if kind not in SEEN_SET_TYPES:
+        raise ValueError(f"Unknown seen set type: {kind}")
+    return SEEN_SET_TYPES[kind]()
+
+def load_seen_set(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def save_seen_set(seen, path):
+    """Write the seen set to disk atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(seen, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
@@ -0,0 +1,33 @@
+import heapq
+import hashlib
+from sqs_utils import INDEXER_QUEUE_NAME
+
+def shard_for_url(url, num_shards):
+    """Stable shard number for a URL, the same on every node and every run"""
+    if num_shards <= 1:
+        return 0
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % num_shards
+
+def shard_queue_name(shard, num_shards):
+    """Indexer queue for a shard; an unsharded index keeps the original queue name"""
+    if num_shards <= 1:
+        return INDEXER_QUEUE_NAME
+    return f"{INDEXER_QUEUE_NAME}-{shard}"
+
+def merge_term_stats(shard_stats):
+    """Combine per-shard term statistics into collection-wide statistics"""
+    merged = {"doc_count": 0, "field_length": {}, "terms": {}}
+    for stats in shard_stats:
+        merged["doc_count"] += stats["doc_count"]
+        for fieldname, length in stats["field_length"].items():
+            merged["field_length"][fieldname] = merged["field_length"].get(fieldname, 0) + length
+        for fieldname, text, doc_frequency in stats["terms"]:
+            key = (fieldname, text)
+            merged["terms"][key] = merged["terms"].get(key, 0) + doc_frequency
+    merged["terms"] = [[fieldname, text, df] for (fieldname, text), df in merged["terms"].items()]
+    return merged
+
+def merge_results(shard_results, limit):
+    """Merge per-shard (url, score) lists into one top-k list"""
+    return heapq.nlargest(limit, (hit for results in shard_results for hit in results), key=lambda hit: hit[1])
@@ -1,9 +1,8 @@
-import boto3
+import os
 import json
 import logging
-from botocore.config import Config
-from botocore.exceptions import ClientError
-from utils import AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY
+import threading
+from metrics import Counter, Histogram
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - SQS - %(levelname)s - %(message)s')
@@ -12,81 +11,259 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - SQS - %(levelname)
 CRAWLER_QUEUE_NAME = 'crawler-queue'
 INDEXER_QUEUE_NAME = 'indexer-queue'
 RESULT_QUEUE_NAME = 'result-queue'
+SEARCH_REPLY_QUEUE_NAME = 'search-reply-queue'
+CONTROL_QUEUE_NAME = 'control-queue'  # heartbeats, task progress and dropped documents, kept off the result queue
 
-try:
-    # Initialize SQS client
-    sqs = boto3.client('sqs',
-        region_name=AWS_REGION,
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_KEY,
-        config=Config(
-            retries=dict(
-                max_attempts=3
+# Backend Configuration
+QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'sqs')  # 'sqs' or 'local'
+LOCAL_QUEUE_PATH = os.environ.get('LOCAL_QUEUE_PATH', 'local_queues.db')
+
+# Batching limits
+MAX_BATCH_SIZE = 10  # SQS accepts at most 10 entries per batch call
+MAX_BATCH_BYTES = 256 * 1024  # SQS limit on the total payload of one batch
+
+# Metrics
+QUEUE_OPERATION_SECONDS = Histogram('queue_operation_seconds', 'Latency of queue backend calls (receive includes long-poll wait)',
+                                    ['operation', 'queue'])
+QUEUE_MESSAGES = Counter('queue_messages_total', 'Messages sent, received or deleted', ['operation', 'queue'])
+QUEUE_ERRORS = Counter('queue_errors_total', 'Failed queue backend calls', ['operation', 'queue'])
+
+def _chunks(bodies):
+    """Split message bodies into batches that respect the SQS batch limits"""
+    batch, batch_bytes = [], 0
+    for body in bodies:
+        size = len(body.encode('utf-8'))
+        if batch and (len(batch) >= MAX_BATCH_SIZE or batch_bytes + size > MAX_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(body)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+class SQSBackend:
+    """Queue backend talking to AWS SQS"""
+
+    def __init__(self):
+        import boto3
+        from botocore.config import Config
+        from utils import AWS_REGION, AWS_ACCESS_KEY, AWS_SECRET_KEY
+
+        try:
+            # Initialize SQS client
+            self.sqs = boto3.client('sqs',
+                region_name=AWS_REGION,
+                aws_access_key_id=AWS_ACCESS_KEY,
+                aws_secret_access_key=AWS_SECRET_KEY,
+                config=Config(
+                    retries=dict(
+                        max_attempts=3
+                    )
+                )
+            )
+            # Test the connection
+            self.sqs.list_queues()
+            logging.info("Successfully connected to AWS SQS")
+        except Exception as e:
+            logging.error(f"Failed to initialize AWS SQS client: {e}")
+            raise
+
+        # Queue URLs never change, so look each one up only once
+        self._queue_urls = {}
+
+    def get_queue_url(self, queue_name):
+        """Get the URL for a queue, creating it if it doesn't exist"""
+        from botocore.exceptions import ClientError
+
+        queue_url = self._queue_urls.get(queue_name)
+        if queue_url:
+            return queue_url
+
+        try:
+            response = self.sqs.get_queue_url(QueueName=queue_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'AWS.SimpleQueueService.NonExistentQueue':
+                logging.info(f"Queue {queue_name} does not exist, creating it...")
+                response = self.sqs.create_queue(QueueName=queue_name)
+            else:
+                logging.error(f"Error getting queue URL for {queue_name}: {e}")
+                raise
+        self._queue_urls[queue_name] = response['QueueUrl']
+        return response['QueueUrl']
+
+    def send_message(self, queue_name, body):
+        response = self.sqs.send_message(
+            QueueUrl=self.get_queue_url(queue_name),
+            MessageBody=body
+        )
+        return response['MessageId']
+
+    def send_messages(self, queue_name, bodies):
+        queue_url = self.get_queue_url(queue_name)
+        message_ids = []
+        for batch in _chunks(bodies):
+            response = self.sqs.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{'Id': str(i), 'MessageBody': body} for i, body in enumerate(batch)]
             )
+            sent = {entry['Id']: entry['MessageId'] for entry in response.get('Successful', [])}
+            for failure in response.get('Failed', []):
+                logging.error(f"Batch send to {queue_name} failed for entry {failure['Id']}: {failure.get('Message')}")
+            message_ids.extend(sent.get(str(i)) for i in range(len(batch)))
+        return message_ids
+
+    def receive_messages(self, queue_name, max_messages=MAX_BATCH_SIZE, wait_time=20):
+        response = self.sqs.receive_message(
+            QueueUrl=self.get_queue_url(queue_name),
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=wait_time
+        )
+        return response.get('Messages', [])
+
+    def change_message_visibility(self, queue_name, receipt_handle, visibility_timeout):
+        self.sqs.change_message_visibility(
+            QueueUrl=self.get_queue_url(queue_name),
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=int(visibility_timeout)
+        )
+
+    def delete_message(self, queue_name, receipt_handle):
+        self.sqs.delete_message(
+            QueueUrl=self.get_queue_url(queue_name),
+            ReceiptHandle=receipt_handle
         )
-    )
-    # Test the connection
-    sqs.list_queues()
-    logging.info("Successfully connected to AWS SQS")
-except Exception as e:
-    logging.error(f"Failed to initialize AWS SQS client: {e}")
-    raise
+
+    def delete_messages(self, queue_name, receipt_handles):
+        queue_url = self.get_queue_url(queue_name)
+        deleted = 0
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            batch = receipt_handles[start:start + MAX_BATCH_SIZE]
+            response = self.sqs.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{'Id': str(i), 'ReceiptHandle': handle} for i, handle in enumerate(batch)]
+            )
+            for failure in response.get('Failed', []):
+                logging.error(f"Batch delete from {queue_name} failed for entry {failure['Id']}: {failure.get('Message')}")
+            deleted += len(response.get('Successful', []))
+        return deleted
+
+    def purge_queue(self, queue_name):
+        self.sqs.purge_queue(QueueUrl=self.get_queue_url(queue_name))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the configured queue backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if QUEUE_BACKEND == 'sqs':
+                    _backend = SQSBackend()
+                elif QUEUE_BACKEND == 'local':
+                    from local_queue import LocalQueueBackend
+                    _backend = LocalQueueBackend(LOCAL_QUEUE_PATH)
+                else:
+                    raise ValueError(f"Unknown queue backend: {QUEUE_BACKEND}")
+    return _backend
 
 def get_queue_url(queue_name):
     """Get the URL for a queue, creating it if it doesn't exist"""
-    try:
-        response = sqs.get_queue_url(QueueName=queue_name)
-        return response['QueueUrl']
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'AWS.SimpleQueueService.NonExistentQueue':
-            logging.info(f"Queue {queue_name} does not exist, creating it...")
-            response = sqs.create_queue(QueueName=queue_name)
-            return response['QueueUrl']
-        else:
-            logging.error(f"Error getting queue URL for {queue_name}: {e}")
-            raise
+    return get_backend().get_queue_url(queue_name)
 
 def send_message(queue_name, message_body):
     """Send a message to the specified queue"""
     try:
-        queue_url = get_queue_url(queue_name)
-        response = sqs.send_message(
-            QueueUrl=queue_url,
-            MessageBody=json.dumps(message_body)
-        )
+        with QUEUE_OPERATION_SECONDS.time(operation='send', queue=queue_name):
+            message_id = get_backend().send_message(queue_name, json.dumps(message_body))
+        QUEUE_MESSAGES.inc(operation='send', queue=queue_name)
         logging.debug(f"Message sent to {queue_name}: {message_body}")
-        return response['MessageId']
+        return message_id
     except Exception as e:
+        QUEUE_ERRORS.inc(operation='send', queue=queue_name)
         logging.error(f"Error sending message to {queue_name}: {e}")
         return None
 
-def receive_messages(queue_name, max_messages=1, wait_time=20):
+def send_messages_batch(queue_name, message_bodies):
+    """Send several messages using as few batch calls as possible.
+
+    Returns the message IDs in the same order as `message_bodies`, with None
+    for any message that could not be sent.
+    """
+    if not message_bodies:
+        return []
+    try:
+        bodies = [json.dumps(body) for body in message_bodies]
+        with QUEUE_OPERATION_SECONDS.time(operation='send_batch', queue=queue_name):
+            message_ids = get_backend().send_messages(queue_name, bodies)
+        QUEUE_MESSAGES.inc(sum(1 for message_id in message_ids if message_id), operation='send', queue=queue_name)
+        logging.debug(f"Sent batch of {len(bodies)} messages to {queue_name}")
+        return message_ids
+    except Exception as e:
+        QUEUE_ERRORS.inc(operation='send_batch', queue=queue_name)
+        logging.error(f"Error sending batch to {queue_name}: {e}")
+        return [None] * len(message_bodies)
+
+def receive_messages(queue_name, max_messages=MAX_BATCH_SIZE, wait_time=20):
     """Receive messages from the specified queue"""
     try:
-        queue_url = get_queue_url(queue_name)
-        response = sqs.receive_message(
-            QueueUrl=queue_url,
-            MaxNumberOfMessages=max_messages,
-            WaitTimeSeconds=wait_time
-        )
-        messages = response.get('Messages', [])
+        with QUEUE_OPERATION_SECONDS.time(operation='receive', queue=queue_name):
+            messages = get_backend().receive_messages(queue_name, max_messages, wait_time)
         if messages:
+            QUEUE_MESSAGES.inc(len(messages), operation='receive', queue=queue_name)
             logging.debug(f"Received {len(messages)} messages from {queue_name}")
         return messages
     except Exception as e:
+        QUEUE_ERRORS.inc(operation='receive', queue=queue_name)
         logging.error(f"Error receiving messages from {queue_name}: {e}")
         return []
 
+def change_message_visibility(queue_name, receipt_handle, visibility_timeout):
+    """Hide a received message for `visibility_timeout` more seconds (0 makes it visible now)"""
+    try:
+        with QUEUE_OPERATION_SECONDS.time(operation='change_visibility', queue=queue_name):
+            get_backend().change_message_visibility(queue_name, receipt_handle, visibility_timeout)
+        return True
+    except Exception as e:
+        QUEUE_ERRORS.inc(operation='change_visibility', queue=queue_name)
+        logging.error(f"Error changing message visibility in {queue_name}: {e}")
+        return False
+
 def delete_message(queue_name, receipt_handle):
     """Delete a message from the queue"""
     try:
-        queue_url = get_queue_url(queue_name)
-        sqs.delete_message(
-            QueueUrl=queue_url,
-            ReceiptHandle=receipt_handle
-        )
+        with QUEUE_OPERATION_SECONDS.time(operation='delete', queue=queue_name):
+            get_backend().delete_message(queue_name, receipt_handle)
+        QUEUE_MESSAGES.inc(operation='delete', queue=queue_name)
         logging.debug(f"Message deleted from {queue_name}")
         return True
     except Exception as e:
+        QUEUE_ERRORS.inc(operation='delete', queue=queue_name)
         logging.error(f"Error deleting message from {queue_name}: {e}")
-        return False 
\ No newline at end of file
+        return False
+
+def delete_messages_batch(queue_name, receipt_handles):
+    """Delete several messages from the queue, returning how many were deleted"""
+    if not receipt_handles:
+        return 0
+    try:
+        with QUEUE_OPERATION_SECONDS.time(operation='delete_batch', queue=queue_name):
+            deleted = get_backend().delete_messages(queue_name, list(receipt_handles))
+        QUEUE_MESSAGES.inc(deleted, operation='delete', queue=queue_name)
+        logging.debug(f"Deleted batch of {deleted} messages from {queue_name}")
+        return deleted
+    except Exception as e:
+        QUEUE_ERRORS.inc(operation='delete_batch', queue=queue_name)
+        logging.error(f"Error deleting batch from {queue_name}: {e}")
+        return 0
+
+def purge_queue(queue_name):
+    """Remove every message from the queue"""
+    try:
+        get_backend().purge_queue(queue_name)
+        logging.info(f"Purged queue {queue_name}")
+        return True
+    except Exception as e:
+        logging.error(f"Error purging queue {queue_name}: {e}")
+        return False
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+# Tracing configuration
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))  # fraction of tasks whose spans are recorded
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'none')  # 'jsonl', 'otlp' or 'none'
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')  # JSONL exporter output, shared by all nodes on a host
+OTLP_ENDPOINT = os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318')  # OTLP/HTTP collector
+EXPORT_BATCH_SIZE = 512  # spans sent per export call
+EXPORT_INTERVAL = 2.0  # seconds a finished span may wait before being exported
+MAX_QUEUED_SPANS = 10000  # spans beyond this are dropped rather than slowing the pipeline
+
+def _new_id(bits):
+    return format(random.getrandbits(bits), f'0{bits // 4}x')
+
+def new_trace():
+    """Trace context for a new task, carried in every message about it.
+
+    Only sampled traces carry stage timestamps and produce spans, so an
+    unsampled task adds little more than its trace id to each message.
+    """
+    trace = {"trace_id": _new_id(128)}
+    if _exporter is not None and random.random() < TRACE_SAMPLE_RATE:
+        trace.update(span_id=_new_id(64), sampled=True, stages={"leased": time.time()})
+    return trace
+
+def is_sampled(trace):
+    return bool(trace and trace.get("sampled"))
+
+def mark_stage(trace, stage, timestamp=None):
+    """Record when the task reached a pipeline stage, for the next node to measure from"""
+    if is_sampled(trace):
+        trace["stages"][stage] = timestamp or time.time()
+
+def stage_time(trace, stage):
+    return trace["stages"].get(stage) if is_sampled(trace) else None
+
+def record_span(trace, name, start, end=None, root=False, **attributes):
+    """Record a finished span of a sampled trace; start and end are Unix timestamps"""
+    if not is_sampled(trace) or start is None or _exporter is None:
+        return
+    span = {
+        "trace_id": trace["trace_id"],
+        # The root span covers the whole task; every stage span is its child
+        "span_id": trace["span_id"] if root else _new_id(64),
+        "parent_span_id": None if root else trace["span_id"],
+        "name": name,
+        "service": _service,
+        "start": start,
+        "end": end or time.time(),
+        "attributes": attributes,
+    }
+    try:
+        _spans.put_nowait(span)
+    except queue.Full:
+        logging.debug(f"Trace queue full, dropping span {name}")
+
+@contextmanager
+def span(trace, name, **attributes):
+    """Record the block as a span of the trace, if it is sampled"""
+    start = time.time()
+    try:
+        yield attributes
+    finally:
+        record_span(trace, name, start, **attributes)
+
+class JsonlExporter:
+    """Appends spans to a local file, one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        data = ''.join(json.dumps(span, separators=(',', ':')) + '\n' for span in spans).encode('utf-8')
+        # One append-mode write per batch, so nodes sharing the file don't interleave lines
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+class OtlpExporter:
+    """Sends spans to an OpenTelemetry collector with OTLP/HTTP JSON"""
+
+    def __init__(self, endpoint):
+        import requests
+
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.session = requests.Session()
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _span(self, span):
+        otlp_span = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(span["start"] * 1e9)),
+            "endTimeUnixNano": str(int(span["end"] * 1e9)),
+            "attributes": [self._attribute(k, v) for k, v in span["attributes"].items() if v is not None],
+        }
+        if span["parent_span_id"]:
+            otlp_span["parentSpanId"] = span["parent_span_id"]
+        return otlp_span
+
+    def export(self, spans):
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span["service"], []).append(self._span(span))
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [self._attribute("service.name", service)]},
+            "scopeSpans": [{"scope": {"name": "crawler-pipeline"}, "spans": service_spans}],
+        } for service, service_spans in by_service.items()]}
+        response = self.session.post(self.url, json=body, timeout=10)
+        response.raise_for_status()
+
+def _create_exporter():
+    if TRACE_EXPORTER == 'jsonl':
+        return JsonlExporter(TRACE_FILE)
+    if TRACE_EXPORTER == 'otlp':
+        return OtlpExporter(OTLP_ENDPOINT)
+    if TRACE_EXPORTER == 'none':
+        return None
+    raise ValueError(f"Unknown trace exporter: {TRACE_EXPORTER}")
+
+_exporter = _create_exporter()
+_service = 'unknown'
+_spans = queue.Queue(maxsize=MAX_QUEUED_SPANS)
+_export_lock = threading.Lock()
+
+def set_service(name):
+    """Name the node that records spans, e.g. 'master' or 'crawler-3'"""
+    global _service
+    _service = name
+
+def flush():
+    """Export every queued span"""
+    with _export_lock:
+        while not _spans.empty():
+            batch = []
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(_spans.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                _exporter.export(batch)
+            except Exception as e:
+                logging.warning(f"Failed to export {len(batch)} spans: {e}")
+
+def _export_loop():
+    while True:
+        time.sleep(EXPORT_INTERVAL)
+        flush()
+
+if _exporter is not None:
+    _export_thread = threading.Thread(target=_export_loop)
+    _export_thread.daemon = True
+    _export_thread.start()
+    atexit.register(flush)
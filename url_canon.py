@@ -0,0 +1,94 @@
+import re
+import string
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, quote
+
+# Configuration
+TRACKING_PARAMS = {
+    'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', '_hsenc', '_hsmi', 'igshid', 'ref_src',
+}
+TRACKING_PARAM_PREFIXES = ('utm_',)
+STRIP_TRAILING_SLASH = False  # treat /docs/ and /docs as the same page
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+_ESCAPE = re.compile(r'%([0-9a-fA-F]{2})')
+_PATH_SAFE = "/:@!$&'()*+,;=%"
+_QUERY_SAFE = "/:@!$'()*,;"
+
+def _normalize_escapes(component, safe):
+    """Decode escaped unreserved characters, uppercase other escapes and escape anything unsafe"""
+    def fix(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else '%' + match.group(1).upper()
+    return quote(_ESCAPE.sub(fix, component), safe=safe)
+
+def remove_dot_segments(path):
+    """Resolve '.' and '..' segments as described in RFC 3986 section 5.2.4"""
+    output = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    # A trailing '.' or '..' still refers to a directory
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output)
+
+def _canonical_netloc(parts, scheme):
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if ':' in host:
+        host = f'[{host}]'  # IPv6 literal
+
+    port = parts.port
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += ':' + parts.password
+        host = f'{userinfo}@{host}'
+    return host
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+def canonicalize_url(url, base_url=None):
+    """Return the canonical form of a URL so that equivalent URLs compare equal.
+
+    Resolves the URL against `base_url`, lowercases the scheme and host,
+    drops default ports, fragments and tracking parameters, resolves dot
+    segments, sorts the query string and normalises percent-encoding.
+    Returns None if the URL cannot be parsed.
+    """
+    try:
+        if base_url:
+            url = urljoin(base_url, url.strip())
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            # Only web URLs are canonicalized; just drop the fragment from anything else
+            return urlunsplit((scheme, parts.netloc, parts.path, parts.query, ''))
+
+        netloc = _canonical_netloc(parts, scheme)
+
+        path = _normalize_escapes(parts.path, _PATH_SAFE)
+        path = remove_dot_segments(re.sub('/{2,}', '/', path)) or '/'
+        if STRIP_TRAILING_SLASH and path != '/':
+            path = path.rstrip('/') or '/'
+
+        params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                  if not _is_tracking_param(k)]
+        query = urlencode(sorted(params), quote_via=quote, safe=_QUERY_SAFE)
+
+        return urlunsplit((scheme, netloc, path, query, ''))
+    except (ValueError, AttributeError):
+        return None